@@ -6,6 +6,9 @@ import os
 
 from ..util import ABCObject
 
+from .index import invalidate_repository_indexes
+from .pkg import package_memo
+from .snapshot import invalidate_repository_snapshots
 from .stack import PMRepoStackWrapper
 
 
@@ -16,6 +19,10 @@ class PackageManager(ABCObject):
 
     config_root = ""
 
+    # objects backing the repositories of the loaded configuration,
+    # see PMRepository._cache_key
+    _cache_owners = ()
+
     @abstractproperty
     def name(self):
         """
@@ -41,9 +48,34 @@ class PackageManager(ABCObject):
         (Re-)load the configuration of a particular package manager. Set up
         internal variables.
 
-        Called by default L{__init__()}.
+        Called by default L{__init__()}. Implementations need to call
+        the base implementation in order to invalidate caches, and set
+        C{_cache_owners} to the objects backing their repositories
+        afterwards.
         """
-        pass
+        package_memo.invalidate()
+        invalidate_repository_indexes(self._cache_owners)
+        invalidate_repository_snapshots(self._cache_owners)
+
+    def enable_memoization(self, maxsize=16384):
+        """
+        Enable memoisation of derived package properties (keys, versions,
+        descriptions, dependency sets...), so that repeated access
+        to the same package does not recreate them. The memo is shared
+        by all package manager instances in the process (values are kept
+        separately for each loaded configuration), and discarded
+        by L{reload_config()}.
+
+        @param maxsize: maximum number of memoised values
+        @type maxsize: int
+        """
+        package_memo.enable(maxsize)
+
+    def disable_memoization(self):
+        """
+        Disable memoisation of derived package properties.
+        """
+        package_memo.disable()
 
     def __init__(self, config_root=""):
         """
@@ -1,6 +1,8 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import functools
+import re
 from abc import abstractmethod, abstractproperty
 
 from ..util import (
@@ -11,6 +13,52 @@ from ..util import (
 )
 
 
+_version_re = re.compile(
+    r"^(\d+)((?:\.\d+)*)([a-z]?)((?:_(?:alpha|beta|pre|rc|p)\d*)*)(?:-r(\d+))?$"
+)
+_suffix_re = re.compile(r"_(alpha|beta|pre|rc|p)(\d*)")
+_suffix_order = {"alpha": 0, "beta": 1, "pre": 2, "rc": 3, "p": 5}
+# terminates the suffix list, sorting between _rc and _p
+_no_suffix = (4, 0)
+
+
+@functools.lru_cache(maxsize=8192)
+def version_sort_key(ver):
+    """
+    Compute a sort key for a package version, following the version
+    comparison rules from the PMS. Comparing the sort keys of two versions
+    gives the same result as comparing the versions.
+
+    @param ver: complete package version (including revision, if any)
+    @type ver: string
+    @return: the sort key
+    @rtype: tuple
+    @raise ValueError: if the version is invalid
+    """
+
+    m = _version_re.match(ver)
+    if m is None:
+        raise ValueError("Invalid version: %s" % ver)
+    first, rest, letter, suffixes, revision = m.groups()
+
+    comps = [(1, int(first))]
+    for c in rest.split(".")[1:]:
+        # components with leading zeros are compared as strings, with
+        # trailing zeros stripped; they always sort before the others
+        if c.startswith("0"):
+            comps.append((0, c.rstrip("0")))
+        else:
+            comps.append((1, int(c)))
+
+    sufs = [
+        (_suffix_order[name], int(num or 0))
+        for name, num in _suffix_re.findall(suffixes)
+    ]
+    sufs.append(_no_suffix)
+
+    return (tuple(comps), letter, tuple(sufs), int(revision or 0))
+
+
 class PMPackageKey(ABCObject, StringCompat):
     """
     A base class for a package key (CP/qualified package name).
@@ -94,6 +142,16 @@ class PMPackageVersion(ABCObject, FillMissingComparisons, StringCompat):
         """
         pass
 
+    @property
+    def sort_key(self):
+        """
+        A totally-ordered key following PMS version comparison rules,
+        suitable for use with C{sorted()} and similar functions.
+
+        @type: tuple
+        """
+        return version_sort_key(str(self))
+
     @abstractmethod
     def __lt__(self, other):
         pass
@@ -189,6 +247,16 @@ class PMAtom(ABCObject, StringifiedComparisons):
         """
         pass
 
+    @abstractproperty
+    def operator(self):
+        """
+        The version operator (C{<}, C{<=}, C{=}, C{=*}, C{~}, C{>=}
+        or C{>}), or C{None} if the atom is unversioned.
+
+        @type: string/C{None}
+        """
+        pass
+
     @abstractproperty
     def slot(self):
         """
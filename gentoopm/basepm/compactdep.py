@@ -0,0 +1,338 @@
+# (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+from array import array
+
+from .depend import (
+    _split_atom_masks,
+    PMAllOfDep,
+    PMAnyOfDep,
+    PMAtMostOneOfDep,
+    PMBaseDep,
+    PMConditionalDep,
+    PMExactlyOneOfDep,
+    PMPackageDepSet,
+)
+
+# node types
+NODE_ATOM = 0
+NODE_ALL_OF = 1
+NODE_ANY_OF = 2
+NODE_EXACTLY_ONE_OF = 3
+NODE_AT_MOST_ONE_OF = 4
+NODE_USE_ENABLED = 5
+NODE_USE_DISABLED = 6
+
+
+class StringTable(object):
+    """
+    A table of interned strings (atoms and USE flags), mapping them
+    to consecutive integer identifiers. A single table can be shared
+    by many dependency trees.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._strings = []
+
+    def intern(self, s):
+        """
+        Get the identifier of a string, adding it to the table if necessary.
+
+        @param s: the string
+        @type s: string
+        @rtype: int
+        """
+        try:
+            return self._ids[s]
+        except KeyError:
+            i = self._ids[s] = len(self._strings)
+            self._strings.append(s)
+            return i
+
+    def get(self, s):
+        """
+        Get the identifier of a string, if it is present in the table.
+
+        @param s: the string
+        @type s: string
+        @rtype: int/C{None}
+        """
+        return self._ids.get(s)
+
+    def __getitem__(self, i):
+        return self._strings[i]
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class CompactDepTree(object):
+    """
+    A compact, read-only representation of a dependency tree.
+
+    The nodes are stored in pre-order in three parallel arrays: node
+    types, subtree end offsets (the index past the last descendant
+    of the node) and values (atom identifiers for atoms, USE flag
+    identifiers for conditionals). The root node is an all-of group.
+    Subtrees of disabled conditionals are skipped by jumping to their
+    end offsets.
+    """
+
+    def __init__(self, table=None):
+        """
+        Create an empty tree.
+
+        @param table: the string table to use (a new one if C{None})
+        @type table: L{StringTable}/C{None}
+        """
+        self.table = table if table is not None else StringTable()
+        self._types = array("B", (NODE_ALL_OF,))
+        self._ends = array("I", (1,))
+        self._values = array("I", (0,))
+
+    @classmethod
+    def from_dep(cls, dep, table=None):
+        """
+        Build the compact form of a dependency tree.
+
+        @param dep: the dependency tree
+        @type dep: L{PMBaseDep}
+        @param table: the string table to use (a new one if C{None})
+        @type table: L{StringTable}/C{None}
+        @rtype: L{CompactDepTree}
+        """
+        self = cls(table)
+        self._add_children(dep)
+        self._ends[0] = len(self._types)
+        return self
+
+    def _add_children(self, dep):
+        for d in dep:
+            i = len(self._types)
+            if isinstance(d, PMConditionalDep):
+                t = NODE_USE_DISABLED if d.negated else NODE_USE_ENABLED
+                v = self.table.intern(d.flag)
+            elif isinstance(d, PMAnyOfDep):
+                t, v = NODE_ANY_OF, 0
+            elif isinstance(d, PMExactlyOneOfDep):
+                t, v = NODE_EXACTLY_ONE_OF, 0
+            elif isinstance(d, PMAtMostOneOfDep):
+                t, v = NODE_AT_MOST_ONE_OF, 0
+            elif isinstance(d, PMAllOfDep):
+                t, v = NODE_ALL_OF, 0
+            else:
+                self._types.append(NODE_ATOM)
+                self._ends.append(i + 1)
+                self._values.append(self.table.intern(str(d)))
+                continue
+
+            self._types.append(t)
+            self._ends.append(0)
+            self._values.append(v)
+            self._add_children(d)
+            self._ends[i] = len(self._types)
+
+    def __len__(self):
+        """
+        The number of nodes in the tree, including the root node.
+        """
+        return len(self._types)
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by node arrays, not including the string table.
+
+        @type: int
+        """
+        return sum(
+            a.itemsize * len(a) for a in (self._types, self._ends, self._values)
+        )
+
+    def _use_ids(self, use):
+        ids = set()
+        for flag in use:
+            i = self.table.get(flag)
+            if i is not None:
+                ids.add(i)
+        return ids
+
+    def atom_ids(self, use=None):
+        """
+        Get identifiers of all atoms in the tree, in order. If C{use}
+        is specified, atoms in disabled USE conditionals are skipped.
+        All alternatives of any-of groups are included.
+
+        @param use: enabled USE flags (or C{None} to include all atoms)
+        @type use: iter(string)/C{None}
+        @rtype: list(int)
+        """
+        types = self._types
+        values = self._values
+        if use is None:
+            return [values[i] for i, t in enumerate(types) if t == NODE_ATOM]
+
+        ids = self._use_ids(use)
+        ends = self._ends
+        ret = []
+        i = 1
+        n = len(types)
+        while i < n:
+            t = types[i]
+            if t == NODE_ATOM:
+                ret.append(values[i])
+            elif (t == NODE_USE_ENABLED and values[i] not in ids) or (
+                t == NODE_USE_DISABLED and values[i] in ids
+            ):
+                i = ends[i]
+                continue
+            i += 1
+        return ret
+
+    def atoms_for_use(self, use_sets):
+        """
+        Resolve the dependencies against multiple sets of enabled USE
+        flags at once, evaluating conditionals for all sets simultaneously
+        as bitmasks. See L{PMBaseDep.atoms_for_use()}.
+
+        @param use_sets: sets of enabled USE flags
+        @type use_sets: list(iter(string))
+        @return: atoms enabled for each of the USE sets
+        @rtype: list(frozenset(string))
+        """
+        use_sets = list(use_sets)
+        full = (1 << len(use_sets)) - 1
+        flag_masks = {}
+        for i, use in enumerate(use_sets):
+            for flag_id in self._use_ids(use):
+                flag_masks[flag_id] = flag_masks.get(flag_id, 0) | (1 << i)
+
+        types = self._types
+        ends = self._ends
+        values = self._values
+        table = self.table
+        atom_masks = {}
+        # (subtree end, mask outside the subtree)
+        stack = []
+        mask = full
+        i = 1
+        n = len(types)
+        while i < n:
+            while stack and i >= stack[-1][0]:
+                mask = stack.pop()[1]
+            t = types[i]
+            if t == NODE_ATOM:
+                k = table[values[i]]
+                atom_masks[k] = atom_masks.get(k, 0) | mask
+            elif t in (NODE_USE_ENABLED, NODE_USE_DISABLED):
+                m = flag_masks.get(values[i], 0)
+                m = mask & m if t == NODE_USE_ENABLED else mask & ~m
+                if not m:
+                    i = ends[i]
+                    continue
+                stack.append((ends[i], mask))
+                mask = m
+            i += 1
+        return _split_atom_masks(atom_masks, len(use_sets))
+
+    def atoms(self, use=None):
+        """
+        Get all atoms in the tree, in order. See L{atom_ids()}.
+
+        @param use: enabled USE flags (or C{None} to include all atoms)
+        @type use: iter(string)/C{None}
+        @rtype: list(string)
+        """
+        table = self.table
+        return [table[i] for i in self.atom_ids(use)]
+
+    @property
+    def flags(self):
+        """
+        USE flags referenced by conditionals in the tree.
+
+        @type: set(string)
+        """
+        table = self.table
+        return set(
+            table[self._values[i]]
+            for i, t in enumerate(self._types)
+            if t in (NODE_USE_ENABLED, NODE_USE_DISABLED)
+        )
+
+    def to_dep(self, atom_cls=str, use=()):
+        """
+        Get a view of the tree implementing the L{PMBaseDep} API.
+
+        @param atom_cls: the class used to instantiate atoms
+        @type atom_cls: type
+        @param use: enabled USE flags, used to evaluate conditionals
+        @type use: iter(string)
+        @rtype: L{PMPackageDepSet}
+        """
+        return CompactPackageDepSet(self, 0, atom_cls, self._use_ids(use))
+
+
+class CompactDep(PMBaseDep):
+    def __init__(self, tree, index, atom_cls, use_ids):
+        self._tree = tree
+        self._index = index
+        self._atom_cls = atom_cls
+        self._use_ids = use_ids
+
+    def __iter__(self):
+        tree = self._tree
+        i = self._index + 1
+        end = tree._ends[self._index]
+        while i < end:
+            t = tree._types[i]
+            if t == NODE_ATOM:
+                yield self._atom_cls(tree.table[tree._values[i]])
+            else:
+                yield _node_classes[t](tree, i, self._atom_cls, self._use_ids)
+            i = tree._ends[i]
+
+
+class CompactAllOfDep(PMAllOfDep, CompactDep):
+    pass
+
+
+class CompactAnyOfDep(PMAnyOfDep, CompactDep):
+    pass
+
+
+class CompactExactlyOneOfDep(PMExactlyOneOfDep, CompactDep):
+    pass
+
+
+class CompactAtMostOneOfDep(PMAtMostOneOfDep, CompactDep):
+    pass
+
+
+class CompactConditionalUseDep(PMConditionalDep, CompactDep):
+    @property
+    def enabled(self):
+        return (self._tree._values[self._index] in self._use_ids) != self.negated
+
+    @property
+    def flag(self):
+        return self._tree.table[self._tree._values[self._index]]
+
+    @property
+    def negated(self):
+        return self._tree._types[self._index] == NODE_USE_DISABLED
+
+
+class CompactPackageDepSet(PMPackageDepSet, CompactDep):
+    pass
+
+
+_node_classes = {
+    NODE_ALL_OF: CompactAllOfDep,
+    NODE_ANY_OF: CompactAnyOfDep,
+    NODE_EXACTLY_ONE_OF: CompactExactlyOneOfDep,
+    NODE_AT_MOST_ONE_OF: CompactAtMostOneOfDep,
+    NODE_USE_ENABLED: CompactConditionalUseDep,
+    NODE_USE_DISABLED: CompactConditionalUseDep,
+}
@@ -45,6 +45,56 @@ class PMRequiredUseAtom(StringCompat):
         return not self._blocks
 
 
+def _collect_atom_masks(deps, mask, flag_masks, atom_masks):
+    """
+    Walk the dependency tree, collecting bitmasks of configurations
+    each atom is enabled in.
+
+    @param deps: the dependency tree
+    @type deps: L{PMBaseDep}
+    @param mask: bitmask of configurations the tree is enabled in
+    @type mask: int
+    @param flag_masks: mapping of USE flags to bitmasks of configurations
+            they are enabled in
+    @type flag_masks: dict(string -> int)
+    @param atom_masks: the mapping of atoms to bitmasks to update
+    @type atom_masks: dict(string -> int)
+    """
+    for d in deps:
+        if isinstance(d, PMConditionalDep):
+            m = flag_masks.get(d.flag, 0)
+            m = mask & ~m if d.negated else mask & m
+            if m:
+                _collect_atom_masks(d, m, flag_masks, atom_masks)
+        elif isinstance(d, PMBaseDep):
+            _collect_atom_masks(d, mask, flag_masks, atom_masks)
+        else:
+            k = str(d)
+            atom_masks[k] = atom_masks.get(k, 0) | mask
+
+
+def _split_atom_masks(atom_masks, count):
+    """
+    Convert a mapping of atoms to configuration bitmasks into atom sets
+    for each configuration.
+
+    @param atom_masks: mapping of atoms to bitmasks
+    @type atom_masks: dict(string -> int)
+    @param count: number of configurations
+    @type count: int
+    @rtype: list(frozenset(string))
+    """
+    ret = [[] for i in range(count)]
+    for atom, m in atom_masks.items():
+        i = 0
+        while m:
+            if m & 1:
+                ret[i].append(atom)
+            m >>= 1
+            i += 1
+    return [frozenset(l) for l in ret]
+
+
 class PMBaseDep(ABCObject):
     """
     Base class for a dependency list holder.
@@ -68,6 +118,29 @@ class PMBaseDep(ABCObject):
         """
         pass
 
+    def atoms_for_use(self, use_sets):
+        """
+        Resolve the dependencies against multiple sets of enabled USE
+        flags at once. The tree is walked only once, with USE conditionals
+        evaluated for all sets simultaneously as bitmasks. All alternatives
+        of any-of groups are included.
+
+        @param use_sets: sets of enabled USE flags
+        @type use_sets: list(iter(string))
+        @return: atoms (as strings) enabled for each of the USE sets
+        @rtype: list(frozenset(string))
+        """
+        use_sets = list(use_sets)
+        flag_masks = {}
+        for i, use in enumerate(use_sets):
+            for flag in use:
+                flag_masks[flag] = flag_masks.get(flag, 0) | (1 << i)
+        atom_masks = {}
+        _collect_atom_masks(
+            self, (1 << len(use_sets)) - 1, flag_masks, atom_masks
+        )
+        return _split_atom_masks(atom_masks, len(use_sets))
+
     def __repr__(self):
         l = ["\n".join(["\t%s" % x for x in repr(d).splitlines()]) for d in self]
         return "%s(\n%s)" % (self.__class__.__name__, ",\n".join(l))
@@ -114,6 +187,25 @@ class PMConditionalDep(PMBaseDep):
         """
         pass
 
+    @abstractproperty
+    def flag(self):
+        """
+        Name of the USE flag the dependency set is conditional on.
+
+        @type: string
+        """
+        pass
+
+    @abstractproperty
+    def negated(self):
+        """
+        Whether the condition is negated (C{!flag? ( ... )}), i.e. the set
+        is enabled when the USE flag is disabled.
+
+        @type: bool
+        """
+        pass
+
 
 class PMAllOfDep(PMBaseDep):
     """
@@ -1,81 +1,407 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import asyncio
 import bz2
+import contextlib
+import io
+import os
+import threading
+import weakref
 
 from ..bash import get_any_bashparser
+from ..bash.bashserver import AsyncBashServer
+from ..bash.declare import DeclareParser
+from ..exceptions import UnsupportedBashCodeError
+from ..util import LRUCache
 
 
-def _load_bp(bp, path):
+class _CachedEnvironment(object):
+    """
+    Decompressed contents of an environment file, along with the result
+    of parsing it using L{DeclareParser}.
     """
-    Load a file onto a bash parser.
 
-    @param bp: the bash parser instance
-    @type bp: L{BashParser}
+    def __init__(self, key, data):
+        self.key = key
+        self.data = data
+        self._parsed = False
+        self._parser = None
+
+    @property
+    def declare_parser(self):
+        """
+        The pure-Python parser with the file loaded, or C{None}
+        if the file is not supported by it.
+
+        @type: L{DeclareParser}/C{None}
+        """
+        if not self._parsed:
+            dp = DeclareParser()
+            try:
+                dp.load_file(io.BytesIO(self.data))
+            except UnsupportedBashCodeError:
+                dp = None
+            self._parser = dp
+            self._parsed = True
+        return self._parser
+
+
+_env_cache = LRUCache(32)
+
+
+def get_environ_cache():
+    """
+    Get the cache of decompressed and parsed environment files. Entries
+    are keyed by path, modification time and size of the file.
+    The C{hits} and C{misses} attributes of the cache can be used
+    to monitor its efficiency.
+
+    @rtype: L{LRUCache}
+    """
+    return _env_cache
+
+
+def _get_env(path):
+    """
+    Get the contents of an environment file, using the cache if possible.
+
     @param path: path to the environment file
     @type path: string
+    @rtype: L{_CachedEnvironment}
     """
-
-    def _try_file(t):
-        f = t(path, "rb")
-        try:
-            bp.load_file(f)
-        finally:
-            f.close()
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    try:
+        return _env_cache[key]
+    except KeyError:
+        pass
 
     try:
-        _try_file(bz2.BZ2File)
+        with bz2.BZ2File(path, "rb") as f:
+            data = f.read()
     except IOError:
-        _try_file(open)
+        with open(path, "rb") as f:
+            data = f.read()
+    env = _env_cache[key] = _CachedEnvironment(key, data)
+    return env
+
+
+def _copy_parsed(env, keys):
+    """
+    Get the values of variables supported by the pure-Python parser.
+
+    @param env: the environment file contents
+    @type env: L{_CachedEnvironment}
+    @param keys: variable names
+    @type keys: list(string)
+    @return: values of the supported variables, and names of variables
+            that need to be queried from bash
+    @rtype: tuple(dict(string -> string), list(string))
+    """
+    dp = env.declare_parser
+    if dp is None:
+        return ({}, list(keys))
+    ret = dp.copy(*[k for k in keys if dp.supports(k)])
+    return (ret, [k for k in keys if k not in ret])
+
+
+def _load_bp(bp, env):
+    """
+    Load an environment onto a bash parser.
+
+    @param bp: the bash parser instance
+    @type bp: L{BashParser}
+    @param env: the environment file contents
+    @type env: L{_CachedEnvironment}
+    """
+    bp.load_file(io.BytesIO(env.data))
+
+
+class _PoolWorker(object):
+    """
+    A bash parser owned by L{BashParserPool}, along with the cache key
+    of the environment file loaded in it.
+    """
 
+    def __init__(self):
+        self.parser = get_any_bashparser()
+        self.key = None
 
-class LazyBashParser(object):
+
+class BashParserPool(object):
     """
-    Lazily-initialized, shared bash parser wrapper.
+    A bounded, thread-safe pool of bash parsers. Parsers are reused
+    for the environment file they have loaded most recently, and the least
+    recently used idle parser is reloaded when no parser has the file
+    loaded already.
     """
 
-    _curr_path = None
-    _parser = None
+    def __init__(self, maxsize=None):
+        """
+        Create a new pool. Parsers are started lazily.
 
-    def set_file(self, path):
+        @param maxsize: maximum number of parsers (defaults to the number
+                of CPUs)
+        @type maxsize: int/C{None}
         """
-        Switch the currently used environment file, if necessary.
+        self._cond = threading.Condition()
+        self._idle = []
+        self._count = 0
+        self.maxsize = maxsize
 
-        @param path: path to the new environment file
-        @type path: string
+    @property
+    def maxsize(self):
+        """
+        The maximum number of parsers in the pool.
+
+        @type: int
         """
+        return self._maxsize
 
-        if self._curr_path == path:
-            return
-        self._curr_path = path
-        if self._parser is None:
-            self._parser = get_any_bashparser()
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        with self._cond:
+            self._maxsize = maxsize or os.cpu_count() or 1
+            while self._count > self._maxsize and self._idle:
+                self._discard(self._idle.pop(0))
+            self._cond.notify_all()
+
+    def _discard(self, w):
+        self._count -= 1
         try:
-            _load_bp(self._parser, path)
-        except Exception as e:
+            w.parser.terminate()
+        except Exception:
+            pass
+
+    def _acquire(self, path):
+        env = _get_env(path)
+        with self._cond:
+            while True:
+                for i in range(len(self._idle) - 1, -1, -1):
+                    if self._idle[i].key == env.key:
+                        return self._idle.pop(i)
+                if self._count < self._maxsize:
+                    self._count += 1
+                    w = None
+                    break
+                if self._idle:
+                    w = self._idle.pop(0)
+                    break
+                self._cond.wait()
+
+        try:
+            if w is None:
+                w = _PoolWorker()
+            _load_bp(w.parser, env)
+        except Exception:
+            with self._cond:
+                if w is not None:
+                    self._discard(w)
+                else:
+                    self._count -= 1
+                self._cond.notify()
+            raise
+        w.key = env.key
+        return w
+
+    def _release(self, w):
+        with self._cond:
+            if self._count > self._maxsize:
+                self._discard(w)
+            else:
+                self._idle.append(w)
+            self._cond.notify()
+
+    def terminate(self):
+        """
+        Terminate all idle parsers in the pool.
+        """
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def parser(self, path):
+        """
+        Get a parser with the specified environment file loaded,
+        for exclusive use within the context. Blocks if all parsers
+        are in use.
+
+        @param path: path to the environment file
+        @type path: string
+        @return: context manager yielding the parser
+        @rtype: L{BashParser}
+        """
+        w = self._acquire(path)
+        try:
+            yield w.parser
+        finally:
+            self._release(w)
+
+
+_pool = BashParserPool()
+
+
+def get_environ_pool():
+    """
+    Get the pool of bash parsers used to access package environments.
+
+    @rtype: L{BashParserPool}
+    """
+    return _pool
+
+
+class _AsyncPoolWorker(object):
+    """
+    An asynchronous bash parser owned by L{AsyncBashParserPool}.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.key = None
+        self.ready = None
+        self.users = 0
+
+
+class AsyncBashParserPool(object):
+    """
+    A bounded pool of asynchronous bash parsers, for use with asyncio.
+    Unlike L{BashParserPool}, a parser that has the requested environment
+    file loaded is shared by all concurrent users, and their queries are
+    pipelined. The pool is bound to the event loop it is used in.
+    """
+
+    def __init__(self, maxsize=None):
+        """
+        Create a new pool. Parsers are started lazily.
+
+        @param maxsize: maximum number of parsers (defaults to the number
+                of CPUs)
+        @type maxsize: int/C{None}
+        """
+        self._cond = asyncio.Condition()
+        # least recently used first
+        self._workers = []
+        self.maxsize = maxsize or os.cpu_count() or 1
+
+    async def _acquire(self, env):
+        async with self._cond:
+            while True:
+                for w in self._workers:
+                    if w.key == env.key:
+                        break
+                else:
+                    if len(self._workers) < self.maxsize:
+                        w = _AsyncPoolWorker()
+                        break
+                    idle = [w for w in self._workers if w.users == 0]
+                    if idle:
+                        w = idle[0]
+                        self._workers.remove(w)
+                        break
+                    await self._cond.wait()
+                    continue
+                self._workers.remove(w)
+                break
+
+            self._workers.append(w)
+            w.users += 1
+            load = w.key != env.key
+            if load:
+                w.key = env.key
+                w.ready = asyncio.get_running_loop().create_future()
+
+        if load:
             try:
-                self._parser.terminate()
-            except:
-                pass
-            self._parser = None
-            raise e
+                if w.server is None:
+                    w.server = AsyncBashServer()
+                    await w.server.start()
+                await w.server.load_file(io.BytesIO(env.data))
+            except BaseException as e:
+                w.key = None
+                if w.server is not None:
+                    await w.server.terminate()
+                    w.server = None
+                if isinstance(e, asyncio.CancelledError):
+                    w.ready.cancel()
+                else:
+                    w.ready.set_exception(e)
+            else:
+                w.ready.set_result(None)
+        try:
+            await asyncio.shield(w.ready)
+        except BaseException:
+            await self._release(w)
+            raise
+        return w
 
-    def __getitem__(self, k):
-        return self._parser[k]
+    async def _release(self, w):
+        async with self._cond:
+            w.users -= 1
+            self._cond.notify()
 
-    def __call__(self, code):
-        return self._parser(code)
+    async def terminate(self):
+        """
+        Terminate all idle parsers in the pool. This should be done
+        before the event loop is closed.
+        """
+        async with self._cond:
+            for w in [w for w in self._workers if w.users == 0]:
+                self._workers.remove(w)
+                if w.server is not None:
+                    await w.server.terminate()
+            self._cond.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def parser(self, env):
+        """
+        Get a parser with the specified environment loaded, for use
+        within the context. Waits if all parsers are in use with other
+        environments.
+
+        @param env: the environment file contents
+        @type env: L{_CachedEnvironment}
+        @return: context manager yielding the parser
+        @rtype: L{AsyncBashServer}
+        """
+        w = await self._acquire(env)
+        try:
+            yield w.server
+        finally:
+            await self._release(w)
 
-    def copy(self, *v):
-        return self._parser.copy(*v)
 
+_async_pools = weakref.WeakKeyDictionary()
 
-_bp = LazyBashParser()
+
+def get_async_environ_pool():
+    """
+    Get the pool of asynchronous bash parsers used to access package
+    environments in the running event loop.
+
+    @rtype: L{AsyncBashParserPool}
+    """
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = _async_pools[loop] = AsyncBashParserPool()
+    return pool
+
+
+def _get_parsed_env(path):
+    env = _get_env(path)
+    env.declare_parser
+    return env
 
 
 class PMPackageEnvironment(object):
     """
     Package environment accessor class.
+
+    Variable values are read using the pure-Python L{DeclareParser}
+    whenever it supports them, and using bash otherwise.
     """
 
     def __init__(self, path):
@@ -96,8 +422,11 @@ class PMPackageEnvironment(object):
         @return: the environment variable value
         @rtype: string
         """
-        _bp.set_file(self._path)
-        return _bp[k]
+        dp = _get_env(self._path).declare_parser
+        if dp is not None and dp.supports(k):
+            return dp[k]
+        with _pool.parser(self._path) as bp:
+            return bp[k]
 
     def __call__(self, code):
         """
@@ -108,8 +437,24 @@ class PMPackageEnvironment(object):
         @return: the return value (exit code)
         @rtype: integer
         """
-        _bp.set_file(self._path)
-        return _bp(code)
+        with _pool.parser(self._path) as bp:
+            return bp(code)
+
+    def eval_many(self, codes, capture=False):
+        """
+        Run multiple bash code snippets in a single exchange with
+        the bash parser, and return their exit codes.
+
+        @param codes: bash code snippets to run
+        @type codes: list(string)
+        @param capture: whether to capture stdout of the snippets
+        @type capture: bool
+        @return: exit codes (or tuples of exit code and stdout,
+                if C{capture} is true)
+        @rtype: list(int)/list(tuple(int, string))
+        """
+        with _pool.parser(self._path) as bp:
+            return bp.eval_many(codes, capture)
 
     def copy(self, *keys):
         """
@@ -120,17 +465,108 @@ class PMPackageEnvironment(object):
         @return: a dict of copied environment keys
         @rtype: dict(string -> string)
         """
-        _bp.set_file(self._path)
-        return _bp.copy(*keys)
+        ret, rest = _copy_parsed(_get_env(self._path), keys)
+        if rest:
+            with _pool.parser(self._path) as bp:
+                ret.update(bp.copy(*rest))
+        return dict((k, ret[k]) for k in keys)
 
     def fork(self):
         """
         Fork the bash parser. In other words, return a completely separate
-        instance with the environment file loaded.
+        instance with the environment file loaded. The fork is cloned
+        from a parser in the pool that has the file loaded already.
 
         @return: forked L{BashParser} instance
         @rtype: L{BashParser}
         """
-        bp = get_any_bashparser()
-        _load_bp(bp, self._path)
-        return bp
+        with _pool.parser(self._path) as bp:
+            return bp.fork()
+
+    def as_async(self):
+        """
+        Get an asyncio-based accessor for the same environment.
+
+        @rtype: L{PMAsyncPackageEnvironment}
+        """
+        return PMAsyncPackageEnvironment(self._path)
+
+
+class PMAsyncPackageEnvironment(object):
+    """
+    Package environment accessor class, for use with asyncio.
+
+    Variable values are read using the pure-Python L{DeclareParser}
+    whenever it supports them, and using the asynchronous bash parser
+    pool (see L{get_async_environ_pool()}) otherwise. File I/O is done
+    in the default executor.
+    """
+
+    def __init__(self, path):
+        """
+        Instantiate L{PMAsyncPackageEnvironment} accessor.
+
+        @param path: path to the environment file
+        @type path: string
+        """
+        self._path = path
+
+    async def _get_env(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _get_parsed_env, self._path)
+
+    async def get(self, k):
+        """
+        Get the value of an environment key by name.
+
+        @param k: the key to access
+        @type k: string
+        @return: the environment variable value
+        @rtype: string
+        """
+        return (await self.copy(k))[k]
+
+    async def run(self, code):
+        """
+        Run the given bash code and return the exit code.
+
+        @param code: bash code to run
+        @type code: string
+        @return: the return value (exit code)
+        @rtype: integer
+        """
+        env = await self._get_env()
+        async with get_async_environ_pool().parser(env) as bp:
+            return await bp.run(code)
+
+    async def eval_many(self, codes, capture=False):
+        """
+        Run multiple bash code snippets and return their exit codes.
+
+        @param codes: bash code snippets to run
+        @type codes: list(string)
+        @param capture: whether to capture stdout of the snippets
+        @type capture: bool
+        @return: exit codes (or tuples of exit code and stdout,
+                if C{capture} is true)
+        @rtype: list(int)/list(tuple(int, string))
+        """
+        env = await self._get_env()
+        async with get_async_environ_pool().parser(env) as bp:
+            return await bp.eval_many(codes, capture)
+
+    async def copy(self, *keys):
+        """
+        Get a number of environment keys as a dict.
+
+        @param keys: keys to access
+        @type keys: strings
+        @return: a dict of copied environment keys
+        @rtype: dict(string -> string)
+        """
+        env = await self._get_env()
+        ret, rest = _copy_parsed(env, keys)
+        if rest:
+            async with get_async_environ_pool().parser(env) as bp:
+                ret.update(await bp.copy(*rest))
+        return dict((k, ret[k]) for k in keys)
@@ -7,6 +7,31 @@ import itertools
 
 from ..util import ABCObject, FillMissingNotEqual
 
+from .atom import PMAtom
+
+FILTER_COST_KEY = 0
+"""Cost of filters using only the package key."""
+FILTER_COST_VERSION = 1
+"""Cost of filters using the package version or other CPV-level data."""
+FILTER_COST_METADATA = 10
+"""Cost of filters requiring package metadata (e.g. from the md5-cache)."""
+FILTER_COST_FILE = 50
+"""Cost of filters requiring reading additional files (e.g. metadata.xml)."""
+FILTER_COST_EXTERNAL = 100
+"""Cost of filters spawning external processes, or of unknown filters."""
+
+_attribute_costs = {
+    "key": FILTER_COST_KEY,
+    "version": FILTER_COST_VERSION,
+    "repository": FILTER_COST_VERSION,
+    "path": FILTER_COST_FILE,
+    "description.long": FILTER_COST_FILE,
+    "maintainers": FILTER_COST_FILE,
+    "repo_masked": FILTER_COST_FILE,
+    "contents": FILTER_COST_FILE,
+    "environ": FILTER_COST_EXTERNAL,
+}
+
 
 class PMPackageMatcher(ABCObject):
     """
@@ -26,6 +51,16 @@ class PMPackageMatcher(ABCObject):
         """
         pass
 
+    @property
+    def cost(self):
+        """
+        Estimated cost of running the matcher on a single package. Used
+        to order the filters so that cheap ones are run first.
+
+        @type: int
+        """
+        return FILTER_COST_EXTERNAL
+
 
 class PMKeywordMatcher(ABCObject, FillMissingNotEqual):
     """
@@ -49,6 +84,16 @@ class PMKeywordMatcher(ABCObject, FillMissingNotEqual):
         """
         pass
 
+    @property
+    def cost(self):
+        """
+        Estimated cost of the comparison, added to the cost of obtaining
+        the metadata value.
+
+        @type: int
+        """
+        return 1
+
 
 class SmartAttrGetter(object):
     """
@@ -113,3 +158,81 @@ def transform_keyword_filters(kwargs):
     """
 
     return itertools.starmap(PMTransformedKeywordFilter, kwargs.items())
+
+
+def attribute_cost(key):
+    """
+    Estimate the cost of obtaining a package attribute.
+
+    @param key: attribute name, possibly dotted (e.g. C{description.short})
+    @type key: string
+    @return: estimated cost
+    @rtype: int
+    """
+
+    parts = key.split(".")
+    while parts:
+        try:
+            return _attribute_costs[".".join(parts)]
+        except KeyError:
+            parts.pop()
+    return FILTER_COST_METADATA
+
+
+def filter_cost(f):
+    """
+    Estimate the cost of running a filter on a single package.
+
+    @param f: a package matcher or an atom
+    @type f: L{PMPackageMatcher}/L{PMAtom}
+    @return: estimated cost
+    @rtype: int
+    """
+
+    from .pkg import PMPackage
+
+    if isinstance(f, PMPackage):
+        return FILTER_COST_VERSION
+    if isinstance(f, PMAtom):
+        # slot restrictions require metadata
+        if f.slot is not None or f.subslot is not None:
+            return FILTER_COST_METADATA
+        return FILTER_COST_VERSION
+    return getattr(f, "cost", FILTER_COST_EXTERNAL)
+
+
+def plan_filters(args):
+    """
+    Order AND-ed filters by their estimated cost, so that the cheap ones
+    are run (and can reject packages) first. Filters of the same cost
+    keep the order they were passed in.
+
+    @param args: filters, as passed to L{PMPackage._matches()}
+    @type args: iter(L{PMPackageMatcher},L{PMAtom})
+    @return: the filters in the order they should be run
+    @rtype: tuple(L{PMPackageMatcher},L{PMAtom})
+    """
+
+    return tuple(sorted(args, key=filter_cost))
+
+
+def pop_key_filter(kwargs):
+    """
+    Find an exact package key filter in keyword filters, so that it can
+    be handled by the PM the same way as an unversioned atom.
+
+    @param kwargs: keyword arguments, as passed
+            to L{basepm.pkgset.PMPackageSet.filter()}
+    @type kwargs: dict
+    @return: the package key (or C{None}) and the remaining keyword
+            arguments
+    @rtype: tuple(string/C{None}, dict)
+    """
+
+    key = kwargs.get("key")
+    # bound keys compare the package state as well, so leave them alone
+    if type(key) is not str or key.count("/") != 1:
+        return (None, kwargs)
+    kwargs = dict(kwargs)
+    del kwargs["key"]
+    return (key, kwargs)
@@ -0,0 +1,466 @@
+# (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import bisect
+
+from .atom import PMAtom
+from .filter import pop_key_filter
+from .pkgset import PMPassThroughPackageSet
+
+# keyed by PMRepository._cache_key
+_repository_indexes = {}
+_name_indexes = {}
+# keyed by tuples of PMRepository._cache_key
+_merged_name_indexes = {}
+
+
+class PMIndexedPackageSet(PMPassThroughPackageSet):
+    """
+    A package set answered from a repository index.
+    """
+
+    def __init__(self, src, desc):
+        PMPassThroughPackageSet.__init__(self, src)
+        self._desc = desc
+
+    def _explain(self):
+        return ["%s(%s)" % (self.__class__.__name__, self._desc)]
+
+
+class _VersionIndex(object):
+    """
+    Packages with a single key, sorted by version, along with slot
+    and subslot buckets.
+    """
+
+    def __init__(self, pkgs):
+        self.all = self._sorted(pkgs)
+        self.slots = {}
+        self.subslots = {}
+        for sk, p in zip(*self.all):
+            self.slots.setdefault(p.slot, []).append(p)
+            self.subslots.setdefault((p.slot, p.subslot), []).append(p)
+        for d in (self.slots, self.subslots):
+            for k, l in d.items():
+                d[k] = self._sorted(l)
+
+    @staticmethod
+    def _sorted(pkgs):
+        l = sorted(((p.version.sort_key, p) for p in pkgs), key=lambda x: x[0])
+        return ([sk for sk, p in l], [p for sk, p in l])
+
+    def match(self, atom):
+        """
+        Get the packages in the version range of an atom. Only the version
+        and slot restrictions are applied.
+
+        @param atom: a complete, non-blocking atom
+        @type atom: L{PMAtom}
+        @return: candidate packages, sorted by version
+        @rtype: list(L{PMPackage})
+        """
+        if atom.slot is None:
+            keys, pkgs = self.all
+        elif atom.subslot is None:
+            keys, pkgs = self.slots.get(atom.slot, ((), ()))
+        else:
+            keys, pkgs = self.subslots.get((atom.slot, atom.subslot), ((), ()))
+
+        op = atom.operator
+        if op in ("<", "<=", "=", ">=", ">"):
+            sk = atom.version.sort_key
+            lo = 0
+            hi = len(keys)
+            if op in ("=", ">="):
+                lo = bisect.bisect_left(keys, sk)
+            elif op == ">":
+                lo = bisect.bisect_right(keys, sk)
+            if op in ("=", "<="):
+                hi = bisect.bisect_right(keys, sk)
+            elif op == "<":
+                hi = bisect.bisect_left(keys, sk)
+            return pkgs[lo:hi]
+        # ~ and =* match ranges that can not be expressed via sort keys
+        return list(pkgs)
+
+
+class RepositoryIndex(object):
+    """
+    An in-memory index of packages in a repository, grouped by category
+    and package name. It allows looking up packages by key without
+    scanning the repository.
+    """
+
+    def __init__(self, repo):
+        """
+        Build the index of all packages in the repository.
+
+        @param repo: the indexed repository
+        @type repo: L{PMRepository}
+        """
+        self._categories = {}
+        self._versions = {}
+        for p in repo:
+            k = p.key
+            self._categories.setdefault(k.category, {}).setdefault(
+                k.package, []
+            ).append(p)
+
+    def __iter__(self):
+        """
+        Iterate over all packages in the index.
+
+        @rtype: iter(L{PMPackage})
+        """
+        for pkgs in self._categories.values():
+            for l in pkgs.values():
+                for p in l:
+                    yield p
+
+    @property
+    def categories(self):
+        """
+        Names of categories containing at least one package.
+
+        @type: list(string)
+        """
+        return sorted(self._categories)
+
+    def packages(self, category):
+        """
+        Names of packages in the specified category.
+
+        @param category: the category name
+        @type category: string
+        @return: package names (without category)
+        @rtype: list(string)
+        """
+        return sorted(self._categories.get(category, ()))
+
+    def _lookup(self, key):
+        cat, _, pkg = str(key).partition("/")
+        return self._categories.get(cat, {}).get(pkg, ())
+
+    def __contains__(self, key):
+        """
+        Check whether a package key is present in the index.
+
+        @param key: the package key (C{category/package})
+        @type key: string
+        @rtype: bool
+        """
+        return bool(self._lookup(key))
+
+    def __getitem__(self, key):
+        """
+        Get all packages with the specified key. Returns an empty set
+        if the key is not present in the index.
+
+        @param key: the package key (C{category/package})
+        @type key: string
+        @return: matching packages
+        @rtype: L{PMPackageSet}
+        """
+        return PMIndexedPackageSet(self._lookup(key), "key=%s" % repr(str(key)))
+
+    def category(self, category):
+        """
+        Get all packages in the specified category.
+
+        @param category: the category name
+        @type category: string
+        @return: matching packages
+        @rtype: L{PMPackageSet}
+        """
+
+        def _iter():
+            for l in self._categories.get(category, {}).values():
+                for p in l:
+                    yield p
+
+        return PMIndexedPackageSet(_iter(), "key.category=%s" % repr(category))
+
+    def versions(self, key):
+        """
+        Get the versions of packages with the specified key.
+
+        @param key: the package key (C{category/package})
+        @type key: string
+        @return: versions, sorted
+        @rtype: list(L{PMPackageVersion})
+        """
+        return sorted((p.version for p in self._lookup(key)), key=lambda v: v.sort_key)
+
+    def slots(self, key):
+        """
+        Get the slots of packages with the specified key.
+
+        @param key: the package key (C{category/package})
+        @type key: string
+        @return: slots
+        @rtype: set(string)
+        """
+        return set(p.slot for p in self._lookup(key))
+
+    def match(self, atom):
+        """
+        Get the packages matching the key, version and slot restrictions
+        of a complete atom. The versions of packages with the atom's key
+        are sorted and bucketed by slot and subslot on first use, so that
+        version operators are answered by binary search. Other parts
+        of the atom (e.g. USE dependencies) are not checked.
+
+        @param atom: a complete, non-blocking atom
+        @type atom: L{PMAtom}
+        @return: candidate packages, sorted by version
+        @rtype: list(L{PMPackage})
+        """
+        key = str(atom.key)
+        vi = self._versions.get(key)
+        if vi is None:
+            pkgs = self._lookup(key)
+            if not pkgs:
+                return []
+            vi = self._versions[key] = _VersionIndex(pkgs)
+        return vi.match(atom)
+
+    def filter(self, args, kwargs):
+        """
+        Try answering filters from the index. Complete atoms, and exact
+        matches on the package key and its category are supported.
+        Atoms are kept in the remaining arguments, to verify the parts
+        not covered by the index.
+
+        @param args: positional arguments, as passed
+                to L{basepm.pkgset.PMPackageSet.filter()}
+        @type args: list
+        @param kwargs: keyword arguments, as passed
+                to L{basepm.pkgset.PMPackageSet.filter()}
+        @type kwargs: dict
+        @return: candidate packages (or C{None} if the index can not help)
+                and the remaining keyword arguments
+        @rtype: tuple(L{PMPackageSet}/C{None}, dict)
+        """
+
+        for a in args:
+            if isinstance(a, PMAtom) and a.complete and not a.blocking:
+                return (
+                    PMIndexedPackageSet(self.match(a), "atom=%s" % repr(str(a))),
+                    kwargs,
+                )
+
+        key, newkwargs = pop_key_filter(kwargs)
+        if key is not None:
+            return (self[key], newkwargs)
+
+        for kw in ("key_category", "key.category"):
+            val = kwargs.get(kw)
+            if type(val) is str:
+                newkwargs = dict(kwargs)
+                del newkwargs[kw]
+                return (self.category(val), newkwargs)
+
+        return (None, kwargs)
+
+
+class PackageNameIndex(object):
+    """
+    An index mapping package names (without category) to categories
+    containing packages with that name. It is used to expand unqualified
+    atoms and to complete package names.
+    """
+
+    def __init__(self, keys):
+        """
+        Build the index.
+
+        @param keys: package keys (C{category/package})
+        @type keys: iter(string)
+        """
+        self._names = {}
+        for k in keys:
+            cat, _, pkg = str(k).partition("/")
+            self._names.setdefault(pkg, set()).add(cat)
+
+    @classmethod
+    def merge(cls, indexes):
+        """
+        Merge multiple indexes (e.g. of all repositories in a stack).
+
+        @param indexes: the indexes to merge
+        @type indexes: iter(L{PackageNameIndex})
+        @rtype: L{PackageNameIndex}
+        """
+        self = cls(())
+        for idx in indexes:
+            for pkg, cats in idx._names.items():
+                self._names.setdefault(pkg, set()).update(cats)
+        return self
+
+    def __contains__(self, name):
+        """
+        Check whether any category contains a package with the name.
+
+        @param name: the package name (without category)
+        @type name: string
+        @rtype: bool
+        """
+        return name in self._names
+
+    def __iter__(self):
+        """
+        Iterate over package names, in no specific order.
+
+        @rtype: iter(string)
+        """
+        return iter(self._names)
+
+    def categories(self, name):
+        """
+        Get the categories containing a package with the name.
+
+        @param name: the package name (without category)
+        @type name: string
+        @return: category names, sorted
+        @rtype: list(string)
+        """
+        return sorted(self._names.get(name, ()))
+
+    def keys(self, name):
+        """
+        Get the package keys matching an unqualified package name.
+
+        @param name: the package name (without category)
+        @type name: string
+        @return: package keys (C{category/package}), sorted
+        @rtype: list(string)
+        """
+        return ["%s/%s" % (cat, name) for cat in self.categories(name)]
+
+    def complete(self, prefix):
+        """
+        Complete a package name or key for shell completion. If the prefix
+        contains a slash, package keys in the category are completed.
+        Otherwise, both package names and categories (with a trailing
+        slash) are completed.
+
+        @param prefix: the text to complete
+        @type prefix: string
+        @return: the completions, sorted
+        @rtype: list(string)
+        """
+        cat, slash, pkg = prefix.partition("/")
+        if slash:
+            return sorted(
+                "%s/%s" % (cat, name)
+                for name, cats in self._names.items()
+                if cat in cats and name.startswith(pkg)
+            )
+
+        ret = set(name for name in self._names if name.startswith(prefix))
+        for cats in self._names.values():
+            ret.update(c + "/" for c in cats if c.startswith(prefix))
+        return sorted(ret)
+
+
+def get_package_name_index(repo):
+    """
+    Get the package name index for a repository, building it on first
+    use. The index is shared by all instances referring to the same
+    repository (in the same package manager instance), until
+    L{invalidate_repository_indexes()} is called.
+
+    @param repo: the repository
+    @type repo: L{PMRepository}
+    @rtype: L{PackageNameIndex}
+    """
+    key = repo._cache_key
+    idx = _name_indexes.get(key)
+    if idx is None:
+        idx = _name_indexes[key] = PackageNameIndex(repo._package_keys())
+    return idx
+
+
+def get_merged_package_name_index(repos):
+    """
+    Get the package name index merged from multiple repositories.
+    The merged index is reused as long as the indexes of all
+    the repositories are unchanged.
+
+    @param repos: the repositories
+    @type repos: iter(L{PMRepository})
+    @rtype: L{PackageNameIndex}
+    """
+    repos = list(repos)
+    indexes = tuple(r.package_names for r in repos)
+    key = tuple(r._cache_key for r in repos)
+    cached = _merged_name_indexes.get(key)
+    if cached is not None and all(a is b for a, b in zip(cached[0], indexes)):
+        return cached[1]
+    idx = PackageNameIndex.merge(indexes)
+    _merged_name_indexes[key] = (indexes, idx)
+    return idx
+
+
+def get_repository_index(repo):
+    """
+    Get the index built for a repository, if any.
+
+    @param repo: the repository
+    @type repo: L{PMEbuildRepository}
+    @rtype: L{RepositoryIndex}/C{None}
+    """
+    return _repository_indexes.get(repo._cache_key)
+
+
+def build_repository_index(repo):
+    """
+    Build (or rebuild) the index for a repository, and store it for use
+    with all instances referring to the same repository (in the same
+    package manager instance).
+
+    @param repo: the repository
+    @type repo: L{PMEbuildRepository}
+    @rtype: L{RepositoryIndex}
+    """
+    key = repo._cache_key
+    _repository_indexes.pop(key, None)
+    idx = _repository_indexes[key] = RepositoryIndex(repo)
+    return idx
+
+
+def drop_repository_index(repo):
+    """
+    Discard the index for a repository, if any.
+
+    @param repo: the repository
+    @type repo: L{PMEbuildRepository}
+    """
+    _repository_indexes.pop(repo._cache_key, None)
+
+
+def invalidate_repository_indexes(owners=None):
+    """
+    Discard repository indexes, including package name indexes.
+
+    @param owners: discard only indexes of repositories backed by these
+            objects (see L{PMRepository._cache_key}), or all indexes
+            if C{None}
+    @type owners: iter(object)/C{None}
+    """
+    if owners is None:
+        _repository_indexes.clear()
+        _name_indexes.clear()
+        _merged_name_indexes.clear()
+        return
+
+    owners = tuple(owners)
+
+    def _owned(k):
+        return any(k[0] is o for o in owners)
+
+    for d in (_repository_indexes, _name_indexes):
+        for k in [k for k in d if _owned(k)]:
+            del d[k]
+    for k in [k for k in _merged_name_indexes if any(_owned(rk) for rk in k)]:
+        del _merged_name_indexes[k]
@@ -1,6 +1,7 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import functools
 import os.path
 from abc import abstractmethod, abstractproperty
 
@@ -10,14 +11,89 @@ from ..util import (
     StringCompat,
     EnumTuple,
     FillMissingNotEqual,
+    LRUCache,
 )
 
 from .atom import PMAtom, PMPackageKey
 from .environ import PMPackageEnvironment
+from .requse import get_required_use_solver
 
 PMPackageState = EnumTuple("PMPackageState", "installable", "installed")
 
 
+class PMPackageMemo(object):
+    """
+    Process-wide memo of derived package properties. Disabled by default,
+    see L{PackageManager.enable_memoization()}.
+    """
+
+    _cache = None
+
+    def enable(self, maxsize):
+        """
+        Enable the memo, discarding the previously memoised values.
+
+        @param maxsize: maximum number of memoised values
+        @type maxsize: int
+        """
+        self._cache = LRUCache(maxsize)
+
+    def disable(self):
+        """
+        Disable the memo and discard the memoised values.
+        """
+        self._cache = None
+
+    def invalidate(self):
+        """
+        Discard the memoised values, keeping the memo enabled if it was.
+        """
+        if self._cache is not None:
+            self._cache.clear()
+
+    @property
+    def cache(self):
+        """
+        The cache holding memoised values, or C{None} if disabled.
+
+        @type: L{LRUCache}/C{None}
+        """
+        return self._cache
+
+
+package_memo = PMPackageMemo()
+
+
+def memoized_property(f):
+    """
+    Create a property whose value is memoised in L{package_memo}, if it
+    is enabled. The package class needs to provide a hashable C{_memo_id}
+    uniquely identifying the package. Since the value is shared by all
+    instances of the same package, it must not refer to the instance.
+
+    @param f: the property getter
+    @type f: func(L{PMPackage})
+    @return: the memoised property
+    @rtype: property
+    """
+
+    name = f.__name__
+
+    @functools.wraps(f)
+    def getter(self):
+        cache = package_memo.cache
+        if cache is None:
+            return f(self)
+        k = (self._memo_id, name)
+        try:
+            return cache[k]
+        except KeyError:
+            ret = cache[k] = f(self)
+            return ret
+
+    return property(getter)
+
+
 class PMBoundPackageKey(FillMissingNotEqual, PMPackageKey):
     """
     A package key bound to a specific package.
@@ -183,6 +259,37 @@ class PMPackage(PMAtom, FillMissingComparisons):
 
         return True
 
+    def _prefetch(self, keys):
+        """
+        Fetch the listed metadata keys in advance and store them
+        for subsequent property access. The default implementation does
+        nothing, for PMs that do not fetch metadata lazily.
+
+        @param keys: metadata keys to fetch (e.g. C{SLOT})
+        @type keys: list(string)
+        """
+        pass
+
+    def _snapshot_entry(self, keys):
+        """
+        Get the raw metadata to store in a repository snapshot.
+        The default implementation raises C{NotImplementedError},
+        for PMs that do not support metadata snapshots.
+
+        @param keys: metadata keys to get (e.g. C{SLOT})
+        @type keys: list(string)
+        @return: the package cpv and metadata values, in order of C{keys}
+        @rtype: tuple(string, tuple(string))
+        """
+        raise NotImplementedError(
+            "Metadata snapshots are not supported by this package manager"
+        )
+
+    @property
+    def operator(self):
+        # packages match as =category/package-version atoms
+        return "="
+
     @abstractproperty
     def path(self):
         """
@@ -340,6 +447,37 @@ class PMPackage(PMAtom, FillMissingComparisons):
         """
         pass
 
+    @abstractproperty
+    def _required_use_string(self):
+        """
+        Get the raw C{REQUIRED_USE} string. The solver parses it
+        on its own since the L{required_use} tree collapses single-member
+        groups.
+
+        @type: string
+        """
+        pass
+
+    @property
+    def required_use_solver(self):
+        """
+        Get a solver for the C{REQUIRED_USE} constraints, with respect
+        to C{IUSE}. The solver is shared by all packages with the same
+        C{REQUIRED_USE} and C{IUSE}. The solver is also kept
+        by the package instance, so that C{REQUIRED_USE} is fetched
+        only once per instance.
+
+        @type: L{RequiredUseSolver}
+        """
+        try:
+            return self._required_use_solver
+        except AttributeError:
+            pass
+        solver = self._required_use_solver = get_required_use_solver(
+            self._required_use_string, (f.name for f in self.use)
+        )
+        return solver
+
     @abstractproperty
     def license(self):
         """
@@ -385,6 +523,16 @@ class PMPackage(PMAtom, FillMissingComparisons):
         """
         pass
 
+    @property
+    def _sort_key(self):
+        """
+        The key used to sort packages. Implementations can provide
+        precomputed keys consistent with C{__lt__()}. The default
+        implementation returns the package itself, so that C{__lt__()}
+        is used.
+        """
+        return self
+
     @abstractmethod
     def __lt__(self, other):
         pass
@@ -2,16 +2,67 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import itertools
+from concurrent.futures import ThreadPoolExecutor
 from abc import abstractmethod
-from collections import defaultdict
+from collections import defaultdict, deque
 from operator import attrgetter
 
-from .filter import transform_keyword_filters
+from .environ import get_environ_pool
+from .filter import transform_keyword_filters, plan_filters, filter_cost
 
 from ..exceptions import EmptyPackageSetError, AmbiguousPackageSetError
 from ..util import ABCObject, BoolCompat
 
 
+def _better_package(best, p):
+    """
+    Return the better of the current best package and a new candidate.
+
+    @param best: the best package found so far (or C{None})
+    @type best: L{PMPackage}/C{None}
+    @param p: the candidate package
+    @type p: L{PMPackage}
+    @return: the better package
+    @rtype: L{PMPackage}
+    @raise AmbiguousPackageSetError: when packages have different keys
+    """
+
+    if best is None:
+        return p
+    if p.key != best.key:
+        raise AmbiguousPackageSetError(
+            ".best called on a set of differently-named packages"
+        )
+    # on ties, prefer the later package, like a stable sort would
+    if p._sort_key < best._sort_key:
+        return best
+    return p
+
+
+def _select_best(pkgs):
+    """
+    Select the best (newest) package from an iterable in a single pass,
+    without sorting it.
+
+    @param pkgs: packages to choose from
+    @type pkgs: iter(L{PMPackage})
+    @return: the best package
+    @rtype: L{PMPackage}
+    @raise EmptyPackageSetError: when no packages were passed
+    @raise AmbiguousPackageSetError: when packages with different keys
+            were passed
+    """
+
+    best = None
+    for p in pkgs:
+        best = _better_package(best, p)
+
+    if best is None:
+        raise EmptyPackageSetError(".best called on an empty set")
+
+    return best
+
+
 class PMPackageSet(ABCObject, BoolCompat):
     """A set of packages."""
 
@@ -64,18 +115,7 @@ class PMPackageSet(ABCObject, BoolCompat):
                 match the condition
         """
 
-        best = None
-        for p in self.sorted:
-            if best is not None and p.key != best.key:
-                raise AmbiguousPackageSetError(
-                    ".best called on a set of differently-named packages"
-                )
-            best = p
-
-        if best is None:
-            raise EmptyPackageSetError(".best called on an empty set")
-
-        return best
+        return _select_best(self)
 
     def select(self, *args, **kwargs):
         """
@@ -130,6 +170,100 @@ class PMPackageSet(ABCObject, BoolCompat):
         """
         return PMPackageGroupDict(self, criteria)
 
+    def prefetch(self, *keys):
+        """
+        Return a variant of the package set whose packages have the listed
+        metadata keys fetched in advance, using a single query per package
+        where the PM supports it. Accessing the relevant properties later
+        will not require querying the PM again.
+
+        The keys are metadata variable names, e.g. C{SLOT} or C{KEYWORDS}.
+        PMs that fetch all metadata at once may ignore the request.
+
+        @param keys: metadata keys to fetch
+        @type keys: list(string)
+        @return: package set with metadata prefetched
+        @rtype: L{PMPrefetchedPackageSet}
+        """
+        return PMPrefetchedPackageSet(self, keys)
+
+    def best_by(self, *criteria):
+        """
+        Return the best package in each group of packages sharing the same
+        values of the specified criteria. This is equivalent
+        to C{[g.best for g in group_by(*criteria)]} but it is computed
+        in a single pass and only the best package of each group is kept
+        in memory.
+
+        The criteria should be specified as L{PMPackage} attribute names.
+
+        @param criteria: list of criteria
+        @type criteria: list(string)
+        @return: package set of the best packages
+        @rtype: L{PMBestByPackageSet}
+        @raise KeyError: when invalid metadata key is referenced in criteria
+        @raise AmbiguousPackageSetError: when packages with different keys
+                fall into the same group
+        """
+        return PMBestByPackageSet(self, criteria)
+
+    def environ_table(self, keys, workers=None):
+        """
+        Iterate over the values of environment variables of all packages
+        in the set. Packages are queried concurrently, using the shared
+        pool of bash parsers (see L{get_environ_pool()}), while the rows
+        are yielded in the order of the set. Only a bounded number
+        of packages is queried ahead of the consumer.
+
+        @param keys: environment variable names
+        @type keys: list(string)
+        @param workers: number of packages queried concurrently (defaults
+                to the size of the parser pool)
+        @type workers: int/C{None}
+        @return: packages along with dicts of variable values
+                (or C{None} for packages with no environment file)
+        @rtype: iter(tuple(L{PMPackage}, dict(string -> string)/C{None}))
+        """
+
+        def _copy(p):
+            env = p.environ
+            if env is None:
+                return None
+            return env.copy(*keys)
+
+        if workers is None:
+            workers = get_environ_pool().maxsize
+        with ThreadPoolExecutor(workers) as executor:
+            pending = deque()
+            try:
+                for p in self:
+                    pending.append((p, executor.submit(_copy, p)))
+                    if len(pending) >= 4 * workers:
+                        p, f = pending.popleft()
+                        yield (p, f.result())
+                while pending:
+                    p, f = pending.popleft()
+                    yield (p, f.result())
+            finally:
+                for p, f in pending:
+                    f.cancel()
+
+    def environ_map(self, keys, workers=None):
+        """
+        Get the values of environment variables of all packages
+        in the set, as a dict. See L{environ_table()}.
+
+        @param keys: environment variable names
+        @type keys: list(string)
+        @param workers: number of packages queried concurrently (defaults
+                to the size of the parser pool)
+        @type workers: int/C{None}
+        @return: mapping of packages to dicts of variable values
+                (or C{None} for packages with no environment file)
+        @rtype: dict(L{PMPackage} -> dict(string -> string)/C{None})
+        """
+        return dict(self.environ_table(keys, workers))
+
     def __getitem__(self, filt):
         """
         Select a single package matching an atom (or filter). Unlike L{select()},
@@ -178,6 +312,25 @@ class PMPackageSet(ABCObject, BoolCompat):
             return False
         return True
 
+    def explain(self):
+        """
+        Describe how the package set is going to be computed, including
+        the order in which the filters are going to be run.
+
+        @return: human-readable evaluation plan
+        @rtype: string
+        """
+        return "\n".join(self._explain())
+
+    def _explain(self):
+        """
+        Return the evaluation plan for L{explain()}, as a list of lines.
+        Sets wrapping other sets should indent the plan of the wrapped set.
+
+        @rtype: list(string)
+        """
+        return [self.__class__.__name__]
+
     def __bool__(self):
         """
         Check whether the package set is non-empty.
@@ -192,6 +345,21 @@ class PMPackageSet(ABCObject, BoolCompat):
         return True
 
 
+def _explain_source(src):
+    """
+    Return indented evaluation plan of a source package set.
+
+    @param src: the source set (or any other iterable)
+    @type src: L{PMPackageSet}/iter
+    @rtype: list(string)
+    """
+    if isinstance(src, PMPackageSet):
+        lines = src._explain()
+    else:
+        lines = [src.__class__.__name__]
+    return ["  %s" % l for l in lines]
+
+
 class PMPassThroughPackageSet(PMPackageSet):
     def __init__(self, src):
         self._src = src
@@ -201,23 +369,70 @@ class PMPassThroughPackageSet(PMPackageSet):
             yield el
 
 
+class PMPrefetchedPackageSet(PMPackageSet):
+    def __init__(self, src, keys):
+        self._src = src
+        self._keys = keys
+
+    def __iter__(self):
+        for el in self._src:
+            el._prefetch(self._keys)
+            yield el
+
+    def _explain(self):
+        return [
+            "%s(%s):" % (self.__class__.__name__, ", ".join(self._keys))
+        ] + _explain_source(self._src)
+
+
 class PMFilteredPackageSet(PMPackageSet):
     def __init__(self, src, args, kwargs):
         self._src = src
-        self._args = tuple(itertools.chain(args, transform_keyword_filters(kwargs)))
+        self._args = plan_filters(
+            itertools.chain(args, transform_keyword_filters(kwargs))
+        )
 
     def __iter__(self):
         for el in self._src:
             if el._matches(*self._args):
                 yield el
 
+    def _explain(self):
+        ret = ["%s:" % self.__class__.__name__]
+        for f in self._args:
+            ret.append("  filter (cost %d): %s" % (filter_cost(f), repr(f)))
+        ret.extend(_explain_source(self._src))
+        return ret
+
 
 class PMSortedPackageSet(PMPackageSet):
     def __init__(self, src):
         self._src = src
 
     def __iter__(self):
-        return iter(sorted(self._src))
+        return iter(sorted(self._src, key=attrgetter("_sort_key")))
+
+    def _explain(self):
+        return ["%s:" % self.__class__.__name__] + _explain_source(self._src)
+
+
+class PMBestByPackageSet(PMPackageSet):
+    def __init__(self, src, criteria):
+        self._src = src
+        self._criteria = criteria
+
+    def __iter__(self):
+        out = {}
+        getters = [attrgetter(c) for c in self._criteria]
+        for p in self._src:
+            key = tuple(g(p) for g in getters)
+            out[key] = _better_package(out.get(key), p)
+        return iter(out.values())
+
+    def _explain(self):
+        return [
+            "%s(%s):" % (self.__class__.__name__, ", ".join(self._criteria))
+        ] + _explain_source(self._src)
 
 
 class PMPackageGroupDict(object):
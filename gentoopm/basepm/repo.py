@@ -11,7 +11,19 @@ from abc import abstractmethod, abstractproperty
 
 from ..util import ABCObject, FillMissingComparisons
 
+from .index import (
+    build_repository_index,
+    drop_repository_index,
+    get_package_name_index,
+    get_repository_index,
+)
+from .snapshot import (
+    drop_repository_snapshot,
+    get_repository_snapshot,
+    load_repository_snapshot,
+)
 from .pkgset import PMPackageSet
+from .revdep import ReverseDependencyIndex
 
 
 class PMRepositoryDict(ABCObject):
@@ -79,6 +91,80 @@ class PMRepository(PMPackageSet):
     Base abstract class for a single repository.
     """
 
+    @property
+    def _cache_key(self):
+        """
+        The key identifying the repository in process-wide caches (indexes,
+        snapshots). It is a tuple whose first element is the object backing
+        the repository (e.g. the package database or configuration
+        of a particular package manager instance), so that the caches
+        of different package manager instances are kept apart and can
+        be discarded separately. The default implementation identifies
+        the repository instance itself.
+
+        @type: tuple
+        """
+        return (None, self)
+
+    @property
+    def index(self):
+        """
+        The in-memory package index of the repository, if available.
+
+        @type: L{RepositoryIndex}/C{None}
+        """
+        return None
+
+    def _index_filter(self, args, kwargs):
+        """
+        Try answering filters from the repository index.
+
+        @param args: positional arguments, as passed to L{filter()}
+        @type args: list
+        @param kwargs: keyword arguments, as passed to L{filter()}
+        @type kwargs: dict
+        @return: candidate packages (or C{None} if no index is available)
+                and the remaining keyword arguments
+        @rtype: tuple(L{PMPackageSet}/C{None}, dict)
+        """
+        return (None, kwargs)
+
+    def _package_keys(self):
+        """
+        Get the keys of all packages in the repository, for building
+        the package name index. Subclasses can override it to avoid
+        iterating over packages.
+
+        @rtype: iter(string)
+        """
+        return set(str(p.key) for p in self)
+
+    @property
+    def package_names(self):
+        """
+        The index mapping package names to categories, built on first
+        use (see L{PackageNameIndex}).
+
+        @type: L{PackageNameIndex}
+        """
+        return get_package_name_index(self)
+
+    def reverse_dependencies(self, cache_file=None):
+        """
+        Build an index of reverse dependencies of packages
+        in the repository. If C{cache_file} is specified, the index
+        is loaded from it, and rebuilt and saved if the file is missing
+        or out-of-date.
+
+        @param cache_file: path to the index file
+        @type cache_file: string/C{None}
+        @rtype: L{ReverseDependencyIndex}
+        @raise OSError: if the index file can not be written
+        """
+        if cache_file is not None:
+            return ReverseDependencyIndex.load(self, cache_file)
+        return ReverseDependencyIndex(self)
+
 
 class GlobalUseFlag(typing.NamedTuple):
     """Global USE flag (as defined by use.desc)"""
@@ -150,6 +236,79 @@ class PMEbuildRepository(PMRepository, FillMissingComparisons):
         """
         pass
 
+    @property
+    def index(self):
+        """
+        The in-memory package index of the repository, if it was built
+        using L{build_index()}. C{None} otherwise.
+
+        @type: L{RepositoryIndex}/C{None}
+        """
+        return get_repository_index(self)
+
+    def build_index(self):
+        """
+        Build an in-memory index of packages in the repository. The index
+        is shared by all instances referring to the same repository
+        and used to answer iteration and key filters without scanning
+        the repository, until L{drop_index()} or
+        L{PackageManager.reload_config()} is called.
+
+        @return: the new index
+        @rtype: L{RepositoryIndex}
+        """
+        return build_repository_index(self)
+
+    def drop_index(self):
+        """
+        Discard the in-memory index of the repository, if any.
+        """
+        drop_repository_index(self)
+
+    def _index_filter(self, args, kwargs):
+        idx = self.index
+        if idx is None:
+            return (None, kwargs)
+        return idx.filter(args, kwargs)
+
+    @property
+    def snapshot(self):
+        """
+        The on-disk metadata snapshot of the repository, if it was loaded
+        using L{load_snapshot()}. C{None} otherwise.
+
+        @type: L{RepositorySnapshot}/C{None}
+        """
+        return get_repository_snapshot(self._cache_key)
+
+    def load_snapshot(self, cache_dir=None):
+        """
+        Load the on-disk metadata snapshot of the repository, building
+        it if it is missing or out-of-date. The snapshot is memory-mapped
+        and used to serve package lists and common metadata (slots,
+        keywords, USE flags, EAPI, inherited eclasses and dependencies)
+        for all instances referring to the same repository, until
+        L{drop_snapshot()} or L{PackageManager.reload_config()} is called.
+
+        The snapshot is stored in C{cache_dir} if specified, or in
+        C{$XDG_CACHE_HOME/gentoopm} (C{~/.cache/gentoopm} by default)
+        otherwise.
+
+        @param cache_dir: the directory to store snapshots in
+        @type cache_dir: string/C{None}
+        @return: the loaded snapshot
+        @rtype: L{RepositorySnapshot}
+        @raise NotImplementedError: if the PM does not support snapshots
+        @raise OSError: if the snapshot can not be written
+        """
+        return load_repository_snapshot(self, cache_dir)
+
+    def drop_snapshot(self):
+        """
+        Stop using the on-disk metadata snapshot of the repository.
+        """
+        drop_repository_snapshot(self._cache_key)
+
     @property
     def global_use(self) -> dict[str, GlobalUseFlag]:
         """Get dict of global USE flags as defined in use.desc"""
@@ -275,3 +434,6 @@ class PMEbuildRepository(PMRepository, FillMissingComparisons):
 
     def __repr__(self):
         return "%s(%s)" % (self.__class__.__name__, repr(self.name))
+
+    def _explain(self):
+        return [repr(self)]
@@ -0,0 +1,317 @@
+# (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import itertools
+import threading
+
+from ..util import LRUCache
+
+_solver_cache = LRUCache(1024)
+
+
+def get_required_use_solver_cache():
+    """
+    Get the cache of REQUIRED_USE solvers. Entries are keyed
+    by the C{REQUIRED_USE} string and C{IUSE}, so packages
+    sharing both share a single solver along with its memoised results.
+    The C{hits} and C{misses} attributes of the cache can be used
+    to monitor its efficiency.
+
+    @rtype: L{LRUCache}
+    """
+    return _solver_cache
+
+
+_group_kinds = {"||": "any", "^^": "one", "??": "most"}
+
+
+def _parse(required_use):
+    """
+    Parse a C{REQUIRED_USE} string into nested tuples. Unlike
+    the dependency parsers of the package managers, this one preserves
+    single-member groups, since e.g. C{|| ( a? ( b ) )} is not
+    equivalent to C{a? ( b )}.
+
+    @param required_use: the C{REQUIRED_USE} string
+    @type required_use: string
+    @rtype: tuple
+    @raise ValueError: if the string is malformed
+    """
+    stack = [[]]
+    heads = []
+    pending = None
+    for t in required_use.split():
+        if pending is not None:
+            if t != "(":
+                raise ValueError("Invalid REQUIRED_USE: %s" % required_use)
+            heads.append(pending)
+            stack.append([])
+            pending = None
+        elif t == "(":
+            heads.append(("all",))
+            stack.append([])
+        elif t == ")":
+            if not heads:
+                raise ValueError("Invalid REQUIRED_USE: %s" % required_use)
+            children = tuple(stack.pop())
+            head = heads.pop()
+            if head[0] == "if":
+                stack[-1].append(head + (children,))
+            else:
+                stack[-1].append((head[0], children))
+        elif t in _group_kinds:
+            pending = (_group_kinds[t],)
+        else:
+            conditional = t.endswith("?")
+            if conditional:
+                t = t[:-1]
+            negated = t.startswith("!")
+            if negated:
+                t = t[1:]
+            if not t or t[0] in "!?()" or t.endswith("?"):
+                raise ValueError("Invalid REQUIRED_USE: %s" % required_use)
+            if conditional:
+                pending = ("if", t, negated)
+            else:
+                stack[-1].append(("flag", t, negated))
+    if pending is not None or heads:
+        raise ValueError("Invalid REQUIRED_USE: %s" % required_use)
+    return tuple(stack[0])
+
+
+def _flags(nodes):
+    for n in nodes:
+        if n[0] == "flag":
+            yield n[1]
+        elif n[0] == "if":
+            yield n[1]
+            yield from _flags(n[3])
+        else:
+            yield from _flags(n[1])
+
+
+def _evaluate(nodes, assign, kind="all"):
+    """
+    Evaluate a group of constraints against a (partial) assignment
+    of USE flags.
+
+    @param nodes: the constraints
+    @type nodes: tuple
+    @param assign: mapping of flags to their states; flags missing
+            from the mapping are undecided
+    @type assign: dict(string -> bool)
+    @param kind: the group type (C{all}, C{any}, C{one} or C{most})
+    @type kind: string
+    @return: whether the group is satisfied, or C{None} if it depends
+            on undecided flags
+    @rtype: bool/C{None}
+    """
+    trues = 0
+    unknown = 0
+    for n in nodes:
+        t = n[0]
+        if t == "flag":
+            v = assign.get(n[1])
+            if v is not None:
+                v = v != n[2]
+        elif t == "if":
+            cond = assign.get(n[1])
+            v = _evaluate(n[3], assign)
+            if kind != "all":
+                # within groups, inactive conditionals are not counted
+                # at all, and active ones count as a single member
+                if cond == n[2] or v is False:
+                    continue
+                if cond is None:
+                    v = None
+            elif cond is None:
+                if v is not True:
+                    v = None
+            elif cond == n[2]:
+                v = True
+        else:
+            v = _evaluate(n[1], assign, t)
+
+        if v is None:
+            unknown += 1
+        elif v:
+            trues += 1
+        elif kind == "all":
+            return False
+
+    if kind == "all":
+        return None if unknown else True
+    # groups with no (active) members are satisfied only for at-most-one-of
+    if kind == "any":
+        if trues:
+            return True
+        return None if unknown else False
+    if trues > 1:
+        return False
+    if unknown:
+        return None
+    return trues == 1 if kind == "one" else True
+
+
+class RequiredUseSolver(object):
+    """
+    A solver for C{REQUIRED_USE} constraints of a package. It can check
+    USE flag configurations, enumerate valid configurations and suggest
+    minimal fixes to invalid ones. Only flags referenced
+    in C{REQUIRED_USE} and present in C{IUSE} are considered, flags
+    outside C{IUSE} are considered disabled. The results are memoised.
+    """
+
+    def __init__(self, required_use, iuse):
+        """
+        Create a solver.
+
+        @param required_use: the C{REQUIRED_USE} tree (as returned
+                by L{_parse()})
+        @type required_use: tuple
+        @param iuse: the flags in C{IUSE}
+        @type iuse: frozenset(string)
+        """
+        self._nodes = required_use
+        self._flags = tuple(sorted(set(_flags(required_use)) & iuse))
+        self._fixed = dict.fromkeys(set(_flags(required_use)) - iuse, False)
+        self._check_cache = LRUCache(256)
+        self._fix_cache = LRUCache(256)
+        self._lock = threading.Lock()
+        self._configs = []
+        self._config_iter = self._enumerate()
+
+    @property
+    def flags(self):
+        """
+        Flags constrained by C{REQUIRED_USE}, sorted.
+
+        @type: tuple(string)
+        """
+        return self._flags
+
+    def _key(self, use):
+        return frozenset(use).intersection(self._flags)
+
+    def _check(self, key):
+        try:
+            return self._check_cache[key]
+        except KeyError:
+            pass
+        assign = dict(self._fixed)
+        for f in self._flags:
+            assign[f] = f in key
+        ret = self._check_cache[key] = _evaluate(self._nodes, assign)
+        return ret
+
+    def check(self, use):
+        """
+        Check whether the USE flag configuration satisfies the constraints.
+
+        @param use: enabled USE flags
+        @type use: iter(string)
+        @rtype: bool
+        """
+        return self._check(self._key(use))
+
+    def _enumerate(self):
+        flags = self._flags
+        assign = dict(self._fixed)
+
+        def _dfs(i):
+            if _evaluate(self._nodes, assign) is False:
+                return
+            if i == len(flags):
+                yield frozenset(f for f in flags if assign[f])
+                return
+            for v in (False, True):
+                assign[flags[i]] = v
+                yield from _dfs(i + 1)
+            del assign[flags[i]]
+
+        return _dfs(0)
+
+    def configurations(self, limit=None):
+        """
+        Enumerate valid configurations of the constrained flags,
+        in the order of a depth-first search over L{flags}, trying
+        each flag disabled before enabled.
+
+        @param limit: maximum number of configurations returned
+                (or C{None} for all)
+        @type limit: int/C{None}
+        @return: sets of enabled flags, among L{flags}
+        @rtype: list(frozenset(string))
+        """
+        with self._lock:
+            while limit is None or len(self._configs) < limit:
+                c = next(self._config_iter, None)
+                if c is None:
+                    break
+                self._configs.append(c)
+            return self._configs[:limit]
+
+    def fix(self, use, max_changes=None):
+        """
+        Suggest a minimal change making the USE flag configuration
+        satisfy the constraints, i.e. toggling the smallest number
+        of constrained flags.
+
+        The candidate changes are tried in the order of increasing size,
+        so the search is exponential in the number of toggled flags. Use
+        C{max_changes} to bound it for packages with many constrained
+        flags.
+
+        @param use: enabled USE flags
+        @type use: iter(string)
+        @param max_changes: maximum number of flags toggled (or C{None}
+                for no limit)
+        @type max_changes: int/C{None}
+        @return: flags to enable and flags to disable (both empty
+                if the configuration is valid already), or C{None}
+                if the constraints can not be satisfied by toggling
+                at most C{max_changes} flags
+        @rtype: tuple(frozenset(string), frozenset(string))/C{None}
+        """
+        key = self._key(use)
+        limit = len(self._flags)
+        if max_changes is not None:
+            limit = min(max_changes, limit)
+        try:
+            return self._fix_cache[(key, limit)]
+        except KeyError:
+            pass
+
+        ret = None
+        if self.configurations(1):
+            for n in range(limit + 1):
+                for toggled in itertools.combinations(self._flags, n):
+                    if self._check(key.symmetric_difference(toggled)):
+                        toggled = frozenset(toggled)
+                        ret = (toggled - key, toggled & key)
+                        break
+                if ret is not None:
+                    break
+        self._fix_cache[(key, limit)] = ret
+        return ret
+
+
+def get_required_use_solver(required_use, iuse):
+    """
+    Get a solver for C{REQUIRED_USE} constraints, reusing the cached
+    one if available.
+
+    @param required_use: the C{REQUIRED_USE} string
+    @type required_use: string
+    @param iuse: names of flags in C{IUSE}
+    @type iuse: iter(string)
+    @rtype: L{RequiredUseSolver}
+    @raise ValueError: if the C{REQUIRED_USE} string is malformed
+    """
+    key = (required_use, frozenset(iuse))
+    try:
+        return _solver_cache[key]
+    except KeyError:
+        pass
+    solver = _solver_cache[key] = RequiredUseSolver(_parse(required_use), key[1])
+    return solver
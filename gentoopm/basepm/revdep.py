@@ -0,0 +1,244 @@
+# (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import json
+import os
+import os.path
+import tempfile
+import typing
+
+from .atom import PMAtom
+from .depend import PMConditionalDep
+from .snapshot import repository_stamp
+
+REVDEP_CACHE_VERSION = 1
+
+# dependency classes, mapped to the package properties holding them
+DEPENDENCY_CLASSES = {
+    "build": "build_dependencies",
+    "cbuild_build": "cbuild_build_dependencies",
+    "run": "run_dependencies",
+    "post": "post_dependencies",
+}
+
+
+class ReverseDependency(typing.NamedTuple):
+    """A single reference to a package key in a dependency specification"""
+
+    package: str
+    """the depending package, as C{category/package-version::repository}"""
+    dep_class: str
+    """the dependency class (a key of L{DEPENDENCY_CLASSES})"""
+    use_condition: tuple[str, ...]
+    """USE flags the dependency is conditional on (C{!flag} if negated)"""
+    atom: str
+    """the dependency atom"""
+
+
+def _package_id(pkg):
+    return "%s-%s::%s" % (pkg.key, pkg.version, pkg.repository)
+
+
+def _walk_deps(deps, cond):
+    for d in deps:
+        if isinstance(d, PMAtom):
+            yield (d, cond)
+        elif isinstance(d, PMConditionalDep):
+            flag = "!" + d.flag if d.negated else d.flag
+            yield from _walk_deps(d, cond + (flag,))
+        else:
+            yield from _walk_deps(d, cond)
+
+
+def _package_deps(pkg):
+    pkg_id = _package_id(pkg)
+    ret = []
+    for dep_class, attr in DEPENDENCY_CLASSES.items():
+        # before EAPI 7, CBUILD dependencies are the same as DEPEND
+        if dep_class == "cbuild_build" and pkg.eapi in (
+            str(x) for x in range(0, 7)
+        ):
+            continue
+        for atom, cond in _walk_deps(getattr(pkg, attr), ()):
+            ret.append(
+                (str(atom.key), ReverseDependency(pkg_id, dep_class, cond, str(atom)))
+            )
+    return ret
+
+
+def _repository_stamps(repo):
+    """
+    Get the stamps of all ebuild repositories comprising C{repo}.
+
+    @return: mapping of repository paths to hex stamps, or C{None}
+            if the repository can not be stamped
+    @rtype: dict(string -> string)/C{None}
+    """
+    from .repo import PMEbuildRepository
+    from .stack import PMRepoStackWrapper
+
+    if isinstance(repo, PMRepoStackWrapper):
+        repos = repo.repositories
+    else:
+        repos = (repo,)
+
+    ret = {}
+    for r in repos:
+        if not isinstance(r, PMEbuildRepository):
+            return None
+        ret[r.path] = repository_stamp(r.path).hex()
+    return ret
+
+
+class ReverseDependencyIndex(object):
+    """
+    An index of reverse dependencies, mapping package keys to all
+    references to them in dependency specifications of packages
+    in a repository (or a repository stack).
+    """
+
+    def __init__(self, repo):
+        """
+        Build the index of all packages in the repository.
+
+        @param repo: the indexed repository
+        @type repo: L{PMRepository}
+        """
+        self._entries = {}
+        self._stamps = _repository_stamps(repo)
+        for pkg in repo:
+            for key, rdep in _package_deps(pkg):
+                self._entries.setdefault(key, []).append(rdep)
+
+    @classmethod
+    def load(cls, repo, path):
+        """
+        Load the index for the repository from a file. If the file does not
+        exist, is invalid or any of the repositories were modified since
+        the index was saved, the index is rebuilt and saved to the file.
+
+        @param repo: the indexed repository
+        @type repo: L{PMRepository}
+        @param path: path to the index file
+        @type path: string
+        @rtype: L{ReverseDependencyIndex}
+        @raise OSError: if the index file can not be written
+        """
+        stamps = _repository_stamps(repo)
+        if stamps is not None:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                pass
+            else:
+                if (
+                    isinstance(data, dict)
+                    and data.get("version") == REVDEP_CACHE_VERSION
+                    and data.get("stamps") == stamps
+                ):
+                    self = cls.__new__(cls)
+                    self._stamps = stamps
+                    self._entries = {
+                        key: [
+                            ReverseDependency(pkg, dep_class, tuple(cond), atom)
+                            for pkg, dep_class, cond, atom in l
+                        ]
+                        for key, l in data["entries"].items()
+                    }
+                    return self
+
+        self = cls(repo)
+        if self._stamps is not None:
+            self.save(path)
+        return self
+
+    def save(self, path):
+        """
+        Save the index to a file. The file is replaced atomically.
+
+        @param path: path to the index file
+        @type path: string
+        @raise OSError: if the file can not be written
+        @raise ValueError: if the repository can not be stamped (i.e. it
+                is not an ebuild repository), and therefore the saved
+                index could not be invalidated
+        """
+        if self._stamps is None:
+            raise ValueError("Only indexes of ebuild repositories can be saved")
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(
+            prefix=os.path.basename(path) + ".", suffix=".tmp", dir=dirname
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(
+                    {
+                        "version": REVDEP_CACHE_VERSION,
+                        "stamps": self._stamps,
+                        "entries": self._entries,
+                    },
+                    f,
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def __iter__(self):
+        """
+        Iterate over package keys referenced by at least one package.
+
+        @rtype: iter(string)
+        """
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """
+        Check whether any package references the package key.
+
+        @param key: the package key (C{category/package})
+        @type key: string
+        @rtype: bool
+        """
+        return str(key) in self._entries
+
+    def __getitem__(self, key):
+        """
+        Get all references to the package key. Returns an empty list
+        if the key is not referenced.
+
+        @param key: the package key (C{category/package})
+        @type key: string
+        @rtype: list(L{ReverseDependency})
+        """
+        return list(self._entries.get(str(key), ()))
+
+    def packages(self, key, dep_classes=None):
+        """
+        Get packages depending on the package key.
+
+        @param key: the package key (C{category/package})
+        @type key: string
+        @param dep_classes: dependency classes to consider (defaults
+                to all of L{DEPENDENCY_CLASSES})
+        @type dep_classes: iter(string)/C{None}
+        @return: identifiers of depending packages
+                (C{category/package-version::repository})
+        @rtype: set(string)
+        """
+        if dep_classes is not None:
+            dep_classes = frozenset(dep_classes)
+        return set(
+            rdep.package
+            for rdep in self._entries.get(str(key), ())
+            if dep_classes is None or rdep.dep_class in dep_classes
+        )
@@ -0,0 +1,367 @@
+# (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import hashlib
+import mmap
+import os
+import os.path
+import struct
+import tempfile
+
+SNAPSHOT_MAGIC = b"GPMSNAP\0"
+SNAPSHOT_VERSION = 1
+
+# metadata keys stored in the snapshot, in record order
+SNAPSHOT_KEYS = (
+    "SLOT",
+    "KEYWORDS",
+    "IUSE",
+    "EAPI",
+    "INHERITED",
+    "DEPEND",
+    "RDEPEND",
+    "PDEPEND",
+    "BDEPEND",
+    "IDEPEND",
+)
+
+# magic, format version, number of keys, number of records, stamp
+_header = struct.Struct("<8sIII8s")
+_offset = struct.Struct("<Q")
+_length = struct.Struct("<I")
+
+# keyed by PMRepository._cache_key
+_repository_snapshots = {}
+
+
+class SnapshotError(Exception):
+    """
+    The snapshot file is invalid or uses an unsupported format.
+    """
+
+    pass
+
+
+def repository_stamp(path):
+    """
+    Compute the stamp for repository metadata. If the repository has
+    a C{metadata/md5-cache} directory, the stamp covers the mtimes
+    of the cache directory and its category subdirectories. Otherwise,
+    it covers the mtimes of category and package directories, ebuilds
+    and eclasses. The C{metadata} directory is not covered in the latter
+    case, so that files written there (e.g. snapshots) do not affect
+    the stamp.
+
+    @param path: path to the ebuild repository
+    @type path: string
+    @return: the stamp
+    @rtype: bytes
+    """
+
+    def _walk(top, rel, depth, suffixes, skip=()):
+        with os.scandir(top) as it:
+            for e in it:
+                if e.name.startswith(".") or e.name in skip:
+                    continue
+                if e.is_dir():
+                    yield ("%s/%s/" % (rel, e.name), e.stat().st_mtime_ns)
+                    if depth > 1:
+                        yield from _walk(
+                            e.path, rel + "/" + e.name, depth - 1, suffixes
+                        )
+                elif e.name.endswith(suffixes):
+                    yield ("%s/%s" % (rel, e.name), e.stat().st_mtime_ns)
+
+    md5_cache = os.path.join(path, "metadata", "md5-cache")
+    if os.path.isdir(md5_cache):
+        top, depth, suffixes, skip = md5_cache, 1, (), ()
+        top_mtime = os.stat(top).st_mtime_ns
+    else:
+        top, depth, suffixes, skip = path, 3, (".ebuild", ".eclass"), ("metadata",)
+        # the top directory mtime would change along with metadata/
+        top_mtime = 0
+
+    h = hashlib.blake2b(digest_size=8)
+    h.update(top.encode("utf8", "surrogateescape"))
+    h.update(b"%d\0" % top_mtime)
+    for rel, mtime in sorted(_walk(top, "", depth, suffixes, skip)):
+        h.update(b"%s\0%d\0" % (rel.encode("utf8", "surrogateescape"), mtime))
+    return h.digest()
+
+
+def write_snapshot(path, stamp, entries):
+    """
+    Write a metadata snapshot file. The file is replaced atomically.
+
+    @param path: path to the snapshot file
+    @type path: string
+    @param stamp: the repository stamp, as returned by L{repository_stamp()}
+    @type stamp: bytes
+    @param entries: pairs of cpv and metadata values, in the order
+            of L{SNAPSHOT_KEYS}
+    @type entries: iter(tuple(string, tuple(string)))
+    """
+
+    def _field(s):
+        b = s.encode("utf8", "surrogateescape")
+        return _length.pack(len(b)) + b
+
+    records = sorted(
+        (cpv.encode("utf8", "surrogateescape"), values) for cpv, values in entries
+    )
+
+    data = []
+    offsets = []
+    pos = _header.size + _offset.size * (len(records) + 1)
+    for cpv, values in records:
+        assert len(values) == len(SNAPSHOT_KEYS)
+        rec = b"".join(
+            [_length.pack(len(cpv)), cpv] + [_field(v) for v in values]
+        )
+        offsets.append(pos)
+        data.append(rec)
+        pos += len(rec)
+    offsets.append(pos)
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=dirname
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(
+                _header.pack(
+                    SNAPSHOT_MAGIC,
+                    SNAPSHOT_VERSION,
+                    len(SNAPSHOT_KEYS),
+                    len(records),
+                    stamp,
+                )
+            )
+            f.write(b"".join(_offset.pack(o) for o in offsets))
+            f.writelines(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class RepositorySnapshot(object):
+    """
+    A read-only, memory-mapped snapshot of repository metadata.
+
+    The file starts with a header (magic, format version, key count,
+    record count and the repository stamp), followed by the table
+    of record offsets and the records. Each record consists
+    of length-prefixed cpv and metadata values, and the records are
+    sorted by cpv to permit binary search.
+    """
+
+    def __init__(self, path):
+        """
+        Open the snapshot file.
+
+        @param path: path to the snapshot file
+        @type path: string
+        @raise SnapshotError: if the file is not a valid snapshot
+        @raise OSError: if the file can not be opened
+        """
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError("%s: empty file" % path)
+
+        try:
+            magic, version, nkeys, count, stamp = _header.unpack_from(self._mm)
+        except struct.error:
+            self.close()
+            raise SnapshotError("%s: truncated header" % path)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise SnapshotError("%s: not a gentoopm snapshot" % path)
+        if version != SNAPSHOT_VERSION or nkeys != len(SNAPSHOT_KEYS):
+            self.close()
+            raise SnapshotError("%s: unsupported version %d" % (path, version))
+
+        self._count = count
+        self._stamp = stamp
+        self.path = path
+
+    def close(self):
+        """
+        Unmap the snapshot file.
+        """
+        self._mm.close()
+
+    @property
+    def stamp(self):
+        """
+        The repository stamp the snapshot was created for.
+
+        @type: bytes
+        """
+        return self._stamp
+
+    def __len__(self):
+        return self._count
+
+    def _record_offset(self, i):
+        return _offset.unpack_from(self._mm, _header.size + _offset.size * i)[0]
+
+    def _field(self, pos):
+        n = _length.unpack_from(self._mm, pos)[0]
+        pos += _length.size
+        return (self._mm[pos : pos + n], pos + n)
+
+    def _cpv(self, i):
+        return self._field(self._record_offset(i))[0]
+
+    def __iter__(self):
+        """
+        Iterate over cpvs in the snapshot, in sorted order.
+
+        @rtype: iter(string)
+        """
+        for i in range(self._count):
+            yield self._cpv(i).decode("utf8", "surrogateescape")
+
+    def _find(self, cpv):
+        b = cpv.encode("utf8", "surrogateescape")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._cpv(mid) < b:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._cpv(lo) == b:
+            return lo
+        return None
+
+    def __contains__(self, cpv):
+        return self._find(cpv) is not None
+
+    def get(self, cpv):
+        """
+        Get the metadata of a package.
+
+        @param cpv: the package cpv
+        @type cpv: string
+        @return: mapping of L{SNAPSHOT_KEYS} to values, or C{None}
+                if the package is not in the snapshot
+        @rtype: dict(string, string)/C{None}
+        """
+        i = self._find(cpv)
+        if i is None:
+            return None
+
+        ret = {}
+        pos = self._field(self._record_offset(i))[1]
+        for k in SNAPSHOT_KEYS:
+            v, pos = self._field(pos)
+            ret[k] = v.decode("utf8", "surrogateescape")
+        return ret
+
+
+def snapshot_path(repo, cache_dir=None):
+    """
+    Get the path to the snapshot file for a repository.
+
+    @param repo: the repository
+    @type repo: L{PMEbuildRepository}
+    @param cache_dir: the directory to store snapshots in. If C{None},
+            the C{gentoopm} subdirectory of the user's cache directory
+            (C{$XDG_CACHE_HOME} or C{~/.cache}) is used.
+    @type cache_dir: string/C{None}
+    @rtype: string
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+            "gentoopm",
+        )
+    h = hashlib.blake2b(repo.path.encode("utf8", "surrogateescape"), digest_size=8)
+    return os.path.join(cache_dir, "%s-%s.snapshot" % (repo.name, h.hexdigest()))
+
+
+def get_repository_snapshot(key):
+    """
+    Get the snapshot loaded for a repository, if any.
+
+    @param key: the cache key of the repository (see
+            L{PMRepository._cache_key})
+    @type key: tuple
+    @rtype: L{RepositorySnapshot}/C{None}
+    """
+    return _repository_snapshots.get(key)
+
+
+def load_repository_snapshot(repo, cache_dir=None):
+    """
+    Load the metadata snapshot for a repository, and use it to serve
+    metadata queries for all instances referring to the same repository
+    (in the same package manager instance). If the snapshot does not exist or is out-of-date, it is (re)built
+    from package metadata.
+
+    @param repo: the repository
+    @type repo: L{PMEbuildRepository}
+    @param cache_dir: the directory to store snapshots in (see
+            L{snapshot_path()})
+    @type cache_dir: string/C{None}
+    @rtype: L{RepositorySnapshot}
+    @raise OSError: if the snapshot can not be written
+    """
+    key = repo._cache_key
+    drop_repository_snapshot(key)
+
+    path = snapshot_path(repo, cache_dir)
+    stamp = repository_stamp(repo.path)
+    try:
+        snap = RepositorySnapshot(path)
+    except (OSError, SnapshotError):
+        pass
+    else:
+        if snap.stamp == stamp:
+            _repository_snapshots[key] = snap
+            return snap
+        snap.close()
+
+    entries = [p._snapshot_entry(SNAPSHOT_KEYS) for p in repo]
+    # querying metadata may have updated the metadata cache
+    write_snapshot(path, repository_stamp(repo.path), entries)
+    snap = _repository_snapshots[key] = RepositorySnapshot(path)
+    return snap
+
+
+def drop_repository_snapshot(key):
+    """
+    Stop using the snapshot for a repository, if any. The snapshot
+    is not closed explicitly since iterators may still be using it,
+    the file is unmapped once it is garbage-collected.
+
+    @param key: the cache key of the repository (see
+            L{PMRepository._cache_key})
+    @type key: tuple
+    """
+    _repository_snapshots.pop(key, None)
+
+
+def invalidate_repository_snapshots(owners=None):
+    """
+    Stop using repository snapshots.
+
+    @param owners: stop using only snapshots of repositories backed
+            by these objects (see L{PMRepository._cache_key}), or all
+            snapshots if C{None}
+    @type owners: iter(object)/C{None}
+    """
+    if owners is not None:
+        owners = tuple(owners)
+    for key in list(_repository_snapshots):
+        if owners is None or any(key[0] is o for o in owners):
+            drop_repository_snapshot(key)
@@ -4,7 +4,9 @@
 from .repo import (PMRepository, GlobalUseFlag, UseExpand, ArchDesc,
                    LicenseDesc, LicenseGroup,
                    )
-from .pkgset import PMPackageSet
+from .index import get_merged_package_name_index
+from .filter import filter_cost, plan_filters, transform_keyword_filters
+from .pkgset import PMPackageSet, _explain_source
 
 
 class PMRepoStackWrapper(PMRepository):
@@ -23,6 +25,34 @@ class PMRepoStackWrapper(PMRepository):
     def filter(self, *args, **kwargs):
         return PMFilteredStackPackageSet(self._repos, args, kwargs)
 
+    @property
+    def repositories(self):
+        """
+        The repositories comprising the stack.
+
+        @type: iter(L{PMRepository})
+        """
+        return self._repos
+
+    @property
+    def package_names(self):
+        """
+        The index mapping package names to categories, merged from all
+        repositories in the stack. The merged index is reused until
+        the index of any of the repositories changes.
+
+        @type: L{PackageNameIndex}
+        """
+        return get_merged_package_name_index(self._repos)
+
+    def build_index(self):
+        """
+        Build in-memory indexes for all repositories in the stack.
+        See L{PMEbuildRepository.build_index()}.
+        """
+        for r in self._repos:
+            r.build_index()
+
     @property
     def global_use(self) -> dict[str, GlobalUseFlag]:
         """Get dict of global USE flags as defined in use.desc"""
@@ -77,15 +107,27 @@ class PMFilteredStackPackageSet(PMPackageSet):
         # keywords may overlap, so only optimize the first set
         self._addkwargs = addkwargs
 
+    @property
+    def _addargs(self):
+        return plan_filters(
+            f for kw in self._addkwargs for f in transform_keyword_filters(kw)
+        )
+
     def __iter__(self):
+        addargs = self._addargs
         for r in self._repos:
             for p in r.filter(*self._args, **self._kwargs):
-                for kw in self._addkwargs:
-                    if not p._matches(**kw):
-                        break
-                else:
+                if p._matches(*addargs):
                     yield p
 
+    def _explain(self):
+        ret = ["%s:" % self.__class__.__name__]
+        for f in self._addargs:
+            ret.append("  filter (cost %d): %s" % (filter_cost(f), repr(f)))
+        for r in self._repos:
+            ret.extend(_explain_source(r.filter(*self._args, **self._kwargs)))
+        return ret
+
     def filter(self, *args, **kwargs):
         return PMFilteredStackPackageSet(
             self._repos, self._args + args, self._kwargs, self._addkwargs + [kwargs]
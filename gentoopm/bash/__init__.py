@@ -34,6 +34,17 @@ class BashParser(ABCObject):
         """
         pass
 
+    def fork(self):
+        """
+        Fork the parser, returning a separate instance with the same
+        state.
+
+        @return: the forked parser
+        @rtype: L{BashParser}
+        @raise NotImplementedError: if the parser does not support forking
+        """
+        raise NotImplementedError("Forking is not supported by this parser")
+
     def copy(self, *varlist):
         """
         Get values of multiple environment variables, and return them
@@ -1,31 +1,135 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-import shutil, subprocess, tempfile
+import asyncio
+import os
+import os.path
+import shlex
+import shutil
+import subprocess
+import tempfile
 
 from ..exceptions import InvalidBashCodeError
 
 from . import BashParser
 
+# the loop is a function, so that it can be reused by forks
 _bash_script = """
-while
-	(
-		while read -r __GENTOOPM_CMD; do
-			eval ${__GENTOOPM_CMD}
-		done
-		exit 1
-	)
-do
-	:
-done
+__gentoopm_loop() {
+	while
+		(
+			while read -r __GENTOOPM_CMD; do
+				eval "${__GENTOOPM_CMD}"
+			done
+			exit 1
+		)
+	do
+		:
+	done
+}
+__gentoopm_loop
 """
 
 
+def _load_commands(size):
+    """
+    Get the commands loading code of the specified size from stdin.
+    The code is passed through the pipe, checked for syntax errors
+    by a separate C{bash -n} process (so that nothing is executed
+    if the check fails) and then evaluated. The check reads the code
+    from a pipe too, as here-strings larger than the pipe buffer are
+    backed by temporary files. Replies with C{OK} or C{FAIL}.
+    """
+    return (
+        "exit 0",
+        "LC_ALL=C IFS= read -r -N %d __GENTOOPM_DATA; "
+        'if printf "%%s" "${__GENTOOPM_DATA}" | "${BASH}" -n &>/dev/null; then '
+        'eval "${__GENTOOPM_DATA}" &>/dev/null; '
+        "unset __GENTOOPM_DATA; "
+        'printf "OK\\0"; '
+        'else printf "FAIL\\0"; fi' % size,
+    )
+
+
+def _print_commands(varlist):
+    """
+    Get the commands printing values of variables, one reply per variable.
+    """
+    q = " ".join(['"${%s}"' % v for v in varlist])
+    return ("set -- %s" % q, 'printf "%s\\0" "${@}"')
+
+
+def _ansi_c_quote(s):
+    """
+    Quote the string for bash, using ANSI-C quoting (C{$'...'}),
+    so that the result fits on a single line of ASCII text.
+    """
+    out = ["$'"]
+    for b in s.encode("utf-8"):
+        if b in (0x27, 0x5C):
+            out.append("\\" + chr(b))
+        elif 0x20 <= b < 0x7F:
+            out.append(chr(b))
+        else:
+            out.append("\\x%02x" % b)
+    out.append("'")
+    return "".join(out)
+
+
+def _eval_commands(codes, capture=False):
+    """
+    Get the commands running each code snippet in a subshell. Replies
+    with the exit status, and the stdout if C{capture} is true,
+    for each snippet.
+    """
+    if capture:
+        # append a sentinel on exit to preserve trailing newlines
+        fmt = (
+            '__GENTOOPM_OUT=$( trap "printf ." EXIT; '
+            "eval %s </dev/null 2>/dev/null ); "
+            'printf "%%d\\0%%s\\0" "${?}" "${__GENTOOPM_OUT%%.}"; '
+            "unset __GENTOOPM_OUT"
+        )
+    else:
+        fmt = '( eval %s ) </dev/null &>/dev/null; printf "%%d\\0" "${?}"'
+    return tuple(fmt % _ansi_c_quote(code) for code in codes)
+
+
+def _eval_results(replies, capture=False):
+    if capture:
+        return [(int(r), out) for r, out in zip(replies[::2], replies[1::2])]
+    return [int(r) for r in replies]
+
+
+def _check_load_reply(ret):
+    if ret == "FAIL":
+        raise InvalidBashCodeError()
+    elif ret != "OK":
+        raise AssertionError("Loading unexpectedly caused stdout output")
+
+
+def _pop_replies(buf, count, ret):
+    """
+    Move complete NUL-terminated replies from the buffer to the list,
+    until it contains C{count} replies.
+    """
+    start = 0
+    while len(ret) < count:
+        end = buf.find(b"\0", start)
+        if end == -1:
+            break
+        ret.append(buf[start:end].decode("utf-8"))
+        start = end + 1
+    del buf[:start]
+
+
 class BashServer(BashParser):
     """
     Bash script parser built on backgrounded bash process.
     """
 
+    _chunk_size = 65536
+
     def __init__(self):
         self._bashproc = subprocess.Popen(
             ["bash", "-c", _bash_script],
@@ -33,62 +137,302 @@ class BashServer(BashParser):
             stdout=subprocess.PIPE,
             env={},
         )
+        self._stdin = self._bashproc.stdin
+        self._stdout = self._bashproc.stdout
+        self._buf = bytearray()
 
     def terminate(self):
         if self._bashproc is not None:
             self._bashproc.terminate()
             self._bashproc.communicate()
             self._bashproc = None
+            self._stdin = self._stdout = None
+            self._buf.clear()
 
-    def load_file(self, envf):
-        with tempfile.NamedTemporaryFile("w+b") as f:
-            shutil.copyfileobj(envf, f)
-            f.flush()
-
-            self._write(
-                "exit 0",
-                'bash -n %s &>/dev/null && printf "OK\\0" || printf "FAIL\\0"'
-                % repr(f.name),
-            )
+    def fork(self):
+        """
+        Fork the parser. The new parser runs in a background subshell
+        of the bash process, and therefore inherits its complete state
+        (including the loaded file) without loading it again. It
+        communicates through a pair of FIFOs.
 
-            if self._read1() != "OK":
-                raise InvalidBashCodeError()
+        @return: the forked parser
+        @rtype: L{BashServerFork}
+        """
+        return BashServerFork(self)
 
-            self._write('source %s &>/dev/null; printf "DONE\\0"' % repr(f.name))
+    def load_file(self, envf):
+        data = envf.read()
+        self._write(*_load_commands(len(data)), data=data)
+        _check_load_reply(self._read1())
 
-            if self._read1() != "DONE":
-                raise AssertionError("Sourcing unexpected caused stdout output")
+    def _read(self, count):
+        """
+        Read the specified number of NUL-terminated replies from bash.
+        The output is read in chunks, and any excess data is kept
+        in the buffer for subsequent calls.
 
-    def _read1(self):
-        assert self._bashproc is not None
-        f = self._bashproc.stdout
-        buf = b" "
-        while not buf.endswith(b"\0"):
-            x = f.read(1)
+        @param count: number of replies to read
+        @type count: int
+        @return: the replies
+        @rtype: list(string)
+        """
+        assert self._stdout is not None
+        f = self._stdout
+        ret = []
+        _pop_replies(self._buf, count, ret)
+        while len(ret) < count:
+            x = f.read1(self._chunk_size)
             if len(x) < 1:
                 # end-of-file
                 raise InvalidBashCodeError()
-            buf += x
-        return buf[1:-1].decode("utf-8")
+            self._buf += x
+            _pop_replies(self._buf, count, ret)
+        return ret
 
-    def _write(self, *cmds):
-        assert self._bashproc is not None
+    def _read1(self):
+        return self._read(1)[0]
+
+    def _write(self, *cmds, data=b""):
+        assert self._stdin is not None
         for cmd in cmds:
-            self._bashproc.stdin.write(("%s\n" % cmd).encode("ASCII"))
-        self._bashproc.stdin.flush()
+            self._stdin.write(("%s\n" % cmd).encode("ASCII"))
+        self._stdin.write(data)
+        self._stdin.flush()
 
     def _cmd_print(self, *varlist):
-        q = " ".join(['"${%s}"' % v for v in varlist])
-        self._write("set -- %s" % q, 'printf "%s\\0" "${@}"')
-        return [self._read1() for v in varlist]
+        if not varlist:
+            return []
+        self._write(*_print_commands(varlist))
+        return self._read(len(varlist))
 
     def __getitem__(self, k):
         return self._cmd_print(k)[0]
 
     def __call__(self, code):
-        self._write('( %s ) &>/dev/null; printf "%%d\\0" "${?}"' % code)
-        return int(self._read1())
+        return self.eval_many([code])[0]
+
+    def eval_many(self, codes, capture=False):
+        """
+        Run multiple code snippets, each in a separate subshell,
+        in a single exchange.
+
+        @param codes: bash code snippets to run
+        @type codes: list(string)
+        @param capture: whether to capture stdout of the snippets
+        @type capture: bool
+        @return: exit codes (or tuples of exit code and stdout,
+                if C{capture} is true)
+        @rtype: list(int)/list(tuple(int, string))
+        """
+        if not codes:
+            return []
+        self._write(*_eval_commands(codes, capture))
+        replies = self._read(len(codes) * (2 if capture else 1))
+        return _eval_results(replies, capture)
 
     def copy(self, *varlist):
         ret = self._cmd_print(*varlist)
         return dict(zip(varlist, ret))
+
+
+class BashServerFork(BashServer):
+    """
+    A fork of L{BashServer}, running in a background subshell of its bash
+    process.
+    """
+
+    def __init__(self, server):
+        """
+        Fork the server.
+
+        @param server: the parent server
+        @type server: L{BashServer}
+        """
+        self._bashproc = None
+        self._stdin = self._stdout = None
+        self._buf = bytearray()
+
+        tmpdir = tempfile.mkdtemp(prefix="gentoopm-fork.")
+        try:
+            in_fifo = os.path.join(tmpdir, "in")
+            out_fifo = os.path.join(tmpdir, "out")
+            os.mkfifo(in_fifo, 0o600)
+            os.mkfifo(out_fifo, 0o600)
+
+            # the subshell opens its output first, so open the FIFOs
+            # in the same order to avoid deadlock
+            server._write(
+                "__gentoopm_loop >%s <%s 2>/dev/null &"
+                % (shlex.quote(out_fifo), shlex.quote(in_fifo)),
+                'printf "OK\\0"',
+            )
+            if server._read1() != "OK":
+                raise AssertionError("Forking unexpectedly caused stdout output")
+            self._stdout = open(out_fifo, "rb")
+            self._stdin = open(in_fifo, "wb")
+        except BaseException:
+            if self._stdout is not None:
+                self._stdout.close()
+            raise
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def terminate(self):
+        # the subshell terminates when its input is closed
+        if self._stdin is not None:
+            self._stdin.close()
+            self._stdout.close()
+            self._stdin = self._stdout = None
+            self._buf.clear()
+
+
+class AsyncBashServer(object):
+    """
+    Bash script parser built on backgrounded bash process, for use
+    with asyncio. Commands are written to bash immediately and replies
+    are read in order, so concurrent queries are pipelined.
+    """
+
+    _chunk_size = 65536
+
+    def __init__(self):
+        self._bashproc = None
+        self._buf = bytearray()
+        self._last = None
+
+    async def start(self):
+        """
+        Start the bash process.
+        """
+        self._bashproc = await asyncio.create_subprocess_exec(
+            "bash",
+            "-c",
+            _bash_script,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env={},
+        )
+
+    async def terminate(self):
+        """
+        Terminate the bash process and wait for it to exit.
+        """
+        if self._bashproc is not None:
+            proc = self._bashproc
+            self._bashproc = None
+            proc.stdin.close()
+            try:
+                proc.terminate()
+            except ProcessLookupError:
+                pass
+            await proc.communicate()
+            self._buf.clear()
+            self._last = None
+
+    async def _read(self, count):
+        f = self._bashproc.stdout
+        ret = []
+        _pop_replies(self._buf, count, ret)
+        while len(ret) < count:
+            x = await f.read(self._chunk_size)
+            if len(x) < 1:
+                # end-of-file
+                raise InvalidBashCodeError()
+            self._buf += x
+            _pop_replies(self._buf, count, ret)
+        return ret
+
+    async def _complete(self, prev, count, done):
+        try:
+            if prev is not None:
+                await asyncio.wait([prev])
+            return await self._read(count)
+        finally:
+            done.set_result(None)
+
+    async def _exchange(self, cmds, count, data=b""):
+        """
+        Write the commands, and read the specified number of replies
+        once the replies to all the preceding commands have been read.
+        """
+        assert self._bashproc is not None
+        stdin = self._bashproc.stdin
+        for cmd in cmds:
+            stdin.write(("%s\n" % cmd).encode("ASCII"))
+        stdin.write(data)
+
+        prev = self._last
+        done = self._last = asyncio.get_running_loop().create_future()
+        # read the replies even if the caller is cancelled, to keep
+        # the stream in sync
+        task = asyncio.ensure_future(self._complete(prev, count, done))
+        await stdin.drain()
+        return await asyncio.shield(task)
+
+    async def load_file(self, envf):
+        """
+        Load and execute the contents of file.
+
+        @param envf: the file to execute
+        @type envf: file
+        @raise InvalidBashCodeError: if the file contains invalid code
+        """
+        data = envf.read()
+        ret = await self._exchange(_load_commands(len(data)), 1, data)
+        _check_load_reply(ret[0])
+
+    async def get(self, k):
+        """
+        Get the value of an environment variable.
+
+        @param k: environment variable name
+        @type k: string
+        @return: value of the environment variable (or C{''} if unset)
+        @rtype: string
+        """
+        return (await self._exchange(_print_commands((k,)), 1))[0]
+
+    async def copy(self, *varlist):
+        """
+        Get values of multiple environment variables.
+
+        @param varlist: environment variable names
+        @type varlist: list(string)
+        @return: environment variables with values
+        @rtype: dict(string -> string)
+        """
+        if not varlist:
+            return {}
+        ret = await self._exchange(_print_commands(varlist), len(varlist))
+        return dict(zip(varlist, ret))
+
+    async def run(self, code):
+        """
+        Run the code in a subshell.
+
+        @param code: bash code to run
+        @type code: string
+        @return: the exit code
+        @rtype: int
+        """
+        return (await self.eval_many([code]))[0]
+
+    async def eval_many(self, codes, capture=False):
+        """
+        Run multiple code snippets, each in a separate subshell.
+
+        @param codes: bash code snippets to run
+        @type codes: list(string)
+        @param capture: whether to capture stdout of the snippets
+        @type capture: bool
+        @return: exit codes (or tuples of exit code and stdout,
+                if C{capture} is true)
+        @rtype: list(int)/list(tuple(int, string))
+        """
+        if not codes:
+            return []
+        replies = await self._exchange(
+            _eval_commands(codes, capture), len(codes) * (2 if capture else 1)
+        )
+        return _eval_results(replies, capture)
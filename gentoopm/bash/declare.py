@@ -0,0 +1,417 @@
+# (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import re
+
+from ..exceptions import UnsupportedBashCodeError
+
+from . import BashParser
+
+# variables that are set or handled specially by bash itself
+_special_vars = frozenset(
+    (
+        "_",
+        "__GENTOOPM_CMD",
+        "BASH",
+        "BASHOPTS",
+        "BASHPID",
+        "COLUMNS",
+        "DIRSTACK",
+        "EPOCHREALTIME",
+        "EPOCHSECONDS",
+        "EUID",
+        "FUNCNAME",
+        "GROUPS",
+        "HISTCMD",
+        "HOSTNAME",
+        "HOSTTYPE",
+        "IFS",
+        "LINENO",
+        "LINES",
+        "MACHTYPE",
+        "OLDPWD",
+        "OPTERR",
+        "OPTIND",
+        "OSTYPE",
+        "PATH",
+        "PIPESTATUS",
+        "PPID",
+        "PS4",
+        "PWD",
+        "RANDOM",
+        "SECONDS",
+        "SHELLOPTS",
+        "SHLVL",
+        "SRANDOM",
+        "UID",
+    )
+)
+
+_name_re = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_int_re = re.compile(r"-?(0|[1-9][0-9]*)$")
+_safe_chars = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_./:,+@%=-"
+)
+_unsafe_chars = frozenset("|&;<>()")
+_func_re = re.compile(r"([^\s()=$`'\"]+) \(\) ?$")
+_heredoc_re = re.compile(r"(?<!<)<<(?!<)(-?)\s*\\?(['\"]?)([A-Za-z0-9_]+)\2")
+
+
+def _unsupported(data, pos, what):
+    line = data.count("\n", 0, pos) + 1
+    return UnsupportedBashCodeError("%s at line %d" % (what, line))
+
+
+_ansi_c_escapes = {
+    "a": b"\a",
+    "b": b"\b",
+    "e": b"\x1b",
+    "E": b"\x1b",
+    "f": b"\f",
+    "n": b"\n",
+    "r": b"\r",
+    "t": b"\t",
+    "v": b"\v",
+    "\\": b"\\",
+    "'": b"'",
+    '"': b'"',
+    "?": b"?",
+}
+_ansi_c_numeric_re = re.compile(
+    r"([0-7]{1,3})|x([0-9A-Fa-f]{1,2})|u([0-9A-Fa-f]{1,4})|U([0-9A-Fa-f]{1,8})"
+)
+
+
+def _parse_ansi_c(data, pos):
+    """
+    Parse an ANSI-C quoted string (C{$'...'}), starting past the opening
+    quote.
+
+    @return: the string value (or C{None} if it can not be decoded)
+            and the position past the closing quote
+    @rtype: tuple(string/C{None}, int)
+    """
+    out = bytearray()
+    n = len(data)
+    while True:
+        if pos >= n:
+            raise _unsupported(data, pos, "Unterminated string")
+        c = data[pos]
+        if c == "'":
+            pos += 1
+            break
+        elif c != "\\":
+            out += c.encode("utf-8", "surrogateescape")
+            pos += 1
+            continue
+
+        pos += 1
+        if pos >= n:
+            raise _unsupported(data, pos, "Unterminated string")
+        c = data[pos]
+        if c in _ansi_c_escapes:
+            out += _ansi_c_escapes[c]
+            pos += 1
+        elif c == "c" and pos + 1 < n:
+            out.append(ord(data[pos + 1]) & 0x1F)
+            pos += 2
+        else:
+            m = _ansi_c_numeric_re.match(data, pos)
+            if m is None:
+                # unknown escapes are kept verbatim
+                out += b"\\"
+            elif m.group(1) is not None:
+                out.append(int(m.group(1), 8) & 0xFF)
+                pos = m.end()
+            elif m.group(2) is not None:
+                out.append(int(m.group(2), 16))
+                pos = m.end()
+            else:
+                out += chr(int(m.group(m.lastindex), 16)).encode(
+                    "utf-8", "surrogatepass"
+                )
+                pos = m.end()
+
+    try:
+        return (out.decode("utf-8"), pos)
+    except UnicodeDecodeError:
+        return (None, pos)
+
+
+def _parse_word(data, pos, stop=" \t\n"):
+    """
+    Parse a single shell word in an assignment.
+
+    @return: the word value (or C{None} if it can not be determined
+            without evaluating it) and the position past the word
+    @rtype: tuple(string/C{None}, int)
+    """
+    out = []
+    literal = True
+    n = len(data)
+    while pos < n:
+        c = data[pos]
+        if c in stop:
+            break
+        elif c == '"':
+            pos += 1
+            while True:
+                if pos >= n:
+                    raise _unsupported(data, pos, "Unterminated string")
+                c = data[pos]
+                if c == '"':
+                    pos += 1
+                    break
+                elif c == "\\" and pos + 1 < n and data[pos + 1] in '$`"\\\n':
+                    if data[pos + 1] != "\n":
+                        out.append(data[pos + 1])
+                    pos += 2
+                elif c in "$`":
+                    raise _unsupported(data, pos, "Expansion")
+                else:
+                    out.append(c)
+                    pos += 1
+        elif c == "'":
+            end = data.find("'", pos + 1)
+            if end == -1:
+                raise _unsupported(data, pos, "Unterminated string")
+            out.append(data[pos + 1 : end])
+            pos = end + 1
+        elif data.startswith("$'", pos):
+            v, pos = _parse_ansi_c(data, pos + 2)
+            if v is None:
+                literal = False
+            else:
+                out.append(v)
+        elif c == "\\":
+            if pos + 1 < n and data[pos + 1] != "\n":
+                out.append(data[pos + 1])
+            pos += 2
+        elif c in _safe_chars:
+            out.append(c)
+            pos += 1
+        elif c in _unsafe_chars or c in "$`":
+            raise _unsupported(data, pos, "Unsupported character %r" % c)
+        else:
+            # globs, tildes... may be subject to expansion
+            literal = False
+            pos += 1
+
+    return ("".join(out) if literal else None, pos)
+
+
+def _parse_array(data, pos):
+    """
+    Skip over an array value, starting past the opening parenthesis.
+
+    @return: the position past the closing parenthesis
+    @rtype: int
+    """
+    n = len(data)
+    while True:
+        while pos < n and data[pos] in " \t\n":
+            pos += 1
+        if pos >= n:
+            raise _unsupported(data, pos, "Unterminated array")
+        if data[pos] == ")":
+            return pos + 1
+        if data[pos] in _unsafe_chars:
+            raise _unsupported(data, pos, "Unsupported character %r" % data[pos])
+        pos = _parse_word(data, pos, " \t\n)")[1]
+
+
+def _skip_function(data, pos):
+    """
+    Skip over a function body, as output by C{declare -f}, starting
+    past the line with function name.
+
+    @return: the position past the function body
+    @rtype: int
+    """
+
+    def _lines(pos):
+        n = len(data)
+        while pos < n:
+            eol = data.find("\n", pos)
+            if eol == -1:
+                eol = n
+            yield (data[pos:eol], eol + 1)
+            pos = eol + 1
+
+    lines = _lines(pos)
+    first, pos = next(lines, ("", pos))
+    if first.rstrip(" ") != "{":
+        raise _unsupported(data, pos, "Unexpected function syntax")
+
+    heredocs = []
+    for l, pos in lines:
+        if heredocs:
+            strip_tabs, delim = heredocs[0]
+            if (l.lstrip("\t") if strip_tabs else l) == delim:
+                heredocs.pop(0)
+        elif l == "}":
+            return pos
+        else:
+            heredocs = [
+                (m.group(1) == "-", m.group(3))
+                for m in _heredoc_re.finditer(l)
+                # skip shifts in arithmetic expressions
+                if l.rfind("((", 0, m.start()) <= l.rfind("))", 0, m.start())
+            ]
+    raise _unsupported(data, pos, "Unterminated function")
+
+
+def parse_declare(data):
+    """
+    Parse an environment file consisting of variable declarations
+    and function definitions, as output by C{declare -p} and
+    C{declare -f}.
+
+    @param data: the file contents
+    @type data: string
+    @return: values of the declared variables, and names of variables
+            whose values can not be determined without bash
+    @rtype: tuple(dict(string -> string), set(string))
+    @raise UnsupportedBashCodeError: if the file contains statements
+            that can not be handled
+    """
+    values = {}
+    fallback = set()
+    readonly = set()
+    attrs = {}
+    n = len(data)
+    pos = 0
+
+    while pos < n:
+        eol = data.find("\n", pos)
+        if eol == -1:
+            eol = n
+        line = data[pos:eol].strip()
+
+        if not line or line.startswith("#"):
+            pos = eol + 1
+            continue
+
+        if not line.startswith("declare "):
+            if _func_re.match(line):
+                pos = _skip_function(data, eol + 1)
+                continue
+            raise _unsupported(data, pos, "Unsupported statement")
+
+        pos = data.index("declare ", pos) + 8
+        flags = ""
+        while True:
+            while pos < n and data[pos] in " \t":
+                pos += 1
+            if data.startswith("--", pos):
+                pos += 2
+            elif data.startswith("-", pos):
+                end = pos + 1
+                while end < n and data[end].isalpha():
+                    end += 1
+                flags += data[pos + 1 : end]
+                pos = end
+            else:
+                break
+        if not set(flags) <= set("aAgiIlnrtux"):
+            raise _unsupported(data, pos, "Unsupported declare flags %r" % flags)
+
+        m = _name_re.match(data, pos)
+        if m is None:
+            raise _unsupported(data, pos, "Invalid variable name")
+        name = m.group(0)
+        pos = m.end()
+
+        if data.startswith("=(", pos):
+            pos = _parse_array(data, pos + 2)
+            value = None
+        elif data.startswith("=", pos):
+            value, pos = _parse_word(data, pos + 1)
+        else:
+            value = values.get(name, "")
+
+        while pos < n and data[pos] in " \t":
+            pos += 1
+        if pos < n and data[pos] != "\n":
+            raise _unsupported(data, pos, "Unexpected trailing data")
+        pos += 1
+
+        # attributes are retained across declarations
+        flags = attrs[name] = attrs.get(name, frozenset()) | frozenset(flags)
+        if value is not None:
+            if "i" in flags and not _int_re.match(value):
+                value = None
+            elif "l" in flags and value != value.lower():
+                value = None
+            elif "u" in flags and value != value.upper():
+                value = None
+        if (
+            value is None
+            or name in readonly
+            or name in _special_vars
+            or name.startswith("BASH_")
+            or flags & frozenset("aAn")
+        ):
+            fallback.add(name)
+        else:
+            values[name] = value
+        if "r" in flags:
+            readonly.add(name)
+
+    return (values, fallback)
+
+
+class DeclareParser(BashParser):
+    """
+    Pure-Python parser for environment files consisting of variable
+    declarations, as saved by bash. It does not support running code,
+    and it can not determine the values of arrays, namerefs, special bash
+    variables and values that require expansion.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._fallback = frozenset()
+
+    def load_file(self, f):
+        """
+        Load and parse the contents of file.
+
+        @param f: the file to parse
+        @type f: file
+        @raise UnsupportedBashCodeError: if the file contains statements
+                that can not be handled
+        """
+        try:
+            data = f.read().decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise UnsupportedBashCodeError(str(e))
+        values, fallback = parse_declare(data)
+        self._values = values
+        self._fallback = frozenset(fallback) | _special_vars
+
+    def supports(self, k):
+        """
+        Check whether the value of the variable can be determined
+        by the parser.
+
+        @param k: environment variable name
+        @type k: string
+        @rtype: bool
+        """
+        return k not in self._fallback and not k.startswith("BASH_")
+
+    def __getitem__(self, k):
+        """
+        Get the value of an environment variable.
+
+        @param k: environment variable name
+        @type k: string
+        @return: value of the environment variable (or C{''} if unset)
+        @rtype: string
+        @raise UnsupportedBashCodeError: if the value can not be determined
+                by the parser
+        """
+        if not self.supports(k):
+            raise UnsupportedBashCodeError("Unsupported variable %s" % k)
+        return self._values.get(k, "")
@@ -41,3 +41,12 @@ class InvalidBashCodeError(PMException):
     """
 
     pass
+
+
+class UnsupportedBashCodeError(PMException):
+    """
+    The bash code can not be handled by the parser, e.g. because
+    it requires evaluating the code.
+    """
+
+    pass
@@ -3,7 +3,7 @@
 
 from operator import attrgetter
 
-from .basepm.filter import PMPackageMatcher
+from .basepm.filter import PMPackageMatcher, PMKeywordMatcher, attribute_cost
 
 
 class AttributeMatch(PMPackageMatcher):
@@ -12,8 +12,19 @@ class AttributeMatch(PMPackageMatcher):
     """
 
     def __init__(self, key, val):
+        self._key = key
         self._getter = attrgetter(key)
         self._val = val
 
     def __call__(self, pkg):
         return self._val == self._getter(pkg)
+
+    @property
+    def cost(self):
+        cost = attribute_cost(self._key)
+        if isinstance(self._val, PMKeywordMatcher):
+            cost += self._val.cost
+        return cost
+
+    def __repr__(self):
+        return "%s(%s == %s)" % (self.__class__.__name__, self._key, repr(self._val))
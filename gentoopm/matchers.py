@@ -25,6 +25,9 @@ class RegExp(PMKeywordMatcher):
     def __eq__(self, val):
         return bool(self._re.match(str(val)))
 
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, repr(self._re.pattern))
+
 
 class Contains(PMKeywordMatcher):
     """
@@ -59,3 +62,7 @@ class Contains(PMKeywordMatcher):
                     return True
 
         return False
+
+    def __repr__(self):
+        elems = list(self._simple_matchers) + self._complex_matchers
+        return "%s(%s)" % (self.__class__.__name__, ", ".join(map(repr, elems)))
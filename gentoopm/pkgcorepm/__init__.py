@@ -22,6 +22,7 @@ class PkgCorePM(PackageManager):
         return pkgcore_version_raw
 
     def reload_config(self):
+        PackageManager.reload_config(self)
         config_root = os.environ.get("PORTAGE_CONFIGROOT", "")
         if self.config_root != "":
             config_root = self.config_root
@@ -30,6 +31,7 @@ class PkgCorePM(PackageManager):
             kwargs["location"] = os.path.join(config_root, "etc", "portage")
         c = load_config(**kwargs)
         self._domain = c.get_default("domain")
+        self._cache_owners = (self._domain,)
 
     @property
     def repositories(self):
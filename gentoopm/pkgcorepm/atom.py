@@ -1,6 +1,8 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import re
+
 from pkgcore.ebuild.atom import atom
 from pkgcore.ebuild.restricts import (
     PackageDep,
@@ -14,6 +16,34 @@ from pkgcore.util.parserestrict import parse_match, ParseError
 
 from ..basepm.atom import PMAtom, PMPackageKey, PMPackageVersion, PMIncompletePackageKey
 from ..exceptions import InvalidAtomStringError
+from ..util import LRUCache
+
+_atom_cache = LRUCache(16384)
+
+
+def get_atom_cache():
+    """
+    Get the cache of parsed atoms. Entries are keyed by the atom string,
+    and hold immutable pkgcore restrictions shared by all L{PkgCoreAtom}
+    instances with the same string. The C{hits} and C{misses} attributes
+    of the cache can be used to monitor its efficiency.
+
+    @rtype: L{LRUCache}
+    """
+    return _atom_cache
+
+
+def _parse_match(s):
+    try:
+        return _atom_cache[s]
+    except KeyError:
+        pass
+    try:
+        r = parse_match(s)
+    except ParseError:
+        raise InvalidAtomStringError("Incorrect atom: %s" % s)
+    _atom_cache[s] = r
+    return r
 
 
 def _find_res(res, cls):
@@ -100,15 +130,19 @@ class PkgCoreIncompletePackageVersion(PMPackageVersion):
         raise NotImplementedError("Unable to compare versions of incomplete atoms")
 
 
+_operator_re = re.compile(r"!{0,2}(<=|>=|<|>|=|~)?[^:\[]*?(\*)?(?:[:\[]|$)")
+
+
 class PkgCoreAtom(PMAtom):
     def __init__(self, s):
         if isinstance(s, atom):
             self._r = s
+            self._op = None
         else:
-            try:
-                self._r = parse_match(s)
-            except ParseError:
-                raise InvalidAtomStringError("Incorrect atom: %s" % s)
+            self._r = _parse_match(s)
+            # incomplete atoms do not keep the operator
+            op, glob = _operator_re.match(s).groups()
+            self._op = op + "*" if op == "=" and glob else op
 
     def __contains__(self, pkg):
         return self._r.match(pkg._pkg) != self.blocking
@@ -157,6 +191,13 @@ class PkgCoreAtom(PMAtom):
             s = s[:-1]
         return s
 
+    @property
+    def operator(self):
+        if self.complete:
+            return self._r.op or None
+        else:
+            return self._op
+
     @property
     def slot(self):
         if self.complete:
@@ -36,7 +36,8 @@ class PkgCoreBaseDep(PMBaseDep):
                 yield PkgCoreAtom(d)
             elif isinstance(d, ContainmentMatch):  # REQUIRED_USE
                 assert len(d.vals) == 1
-                yield PMRequiredUseAtom(next(iter(d.vals)))
+                flag = next(iter(d.vals))
+                yield PMRequiredUseAtom("!" + flag if d.negate else flag)
             elif isinstance(d, OrRestriction):
                 yield PkgCoreAnyOfDep(d, self._pkg)
             elif isinstance(d, AndRestriction):
@@ -74,6 +75,15 @@ class PkgCoreConditionalUseDep(PMConditionalDep, PkgCoreBaseDep):
     def enabled(self):
         return self._deps.restriction.match(self._pkg.use)
 
+    @property
+    def flag(self):
+        (flag,) = self._deps.restriction.vals
+        return flag
+
+    @property
+    def negated(self):
+        return self._deps.restriction.negate
+
 
 class PkgCorePackageDepSet(PMPackageDepSet, PkgCoreAllOfDep):
     @property
@@ -2,17 +2,32 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import pkgcore.restrictions.boolean as br
+from pkgcore.restrictions import packages, values
+
+from ..basepm.filter import pop_key_filter
+from ..exceptions import InvalidAtomStringError
 
 from .atom import PkgCoreAtom
 from .pkg import PkgCorePackage
 
 
+_key_part_filters = {
+    "key_category": "category",
+    "key.category": "category",
+    "key_package": "package",
+    "key.package": "package",
+}
+
+
 def transform_filters(args, kwargs):
     """
     Transform our filters into pkgcore restrictions whenever possible. Takes
     args and kwargs as passed to .filter() and returns a tuple (restriction,
     newargs, newkwargs).
 
+    Atoms are transformed into restrictions, and so are exact matches
+    on the package key and its parts.
+
     If no filters can be transformed, None is returned as restriction,
     and args & kwargs are returned unmodified.
     """
@@ -30,6 +45,22 @@ def transform_filters(args, kwargs):
         else:
             newargs.append(a)
 
+    key, newkwargs = pop_key_filter(kwargs)
+    if key is not None:
+        try:
+            f.append(PkgCoreAtom(key)._r)
+        except InvalidAtomStringError:
+            pass
+        else:
+            kwargs = newkwargs
+
+    for kw, attr in _key_part_filters.items():
+        val = kwargs.get(kw)
+        if type(val) is str:
+            kwargs = dict(kwargs)
+            del kwargs[kw]
+            f.append(packages.PackageRestriction(attr, values.StrExactMatch(val)))
+
     if not f:
         f = None
     elif len(f) == 1:
@@ -10,6 +10,7 @@ from ..basepm.pkg import (
     PMPackageState,
     PMUseFlag,
     PMPackageMaintainer,
+    memoized_property,
 )
 from ..basepm.pkgset import PMPackageSet, PMFilteredPackageSet
 from ..util import SpaceSepTuple, SpaceSepFrozenSet
@@ -109,6 +110,11 @@ class PkgCorePackage(PMPackage, PkgCoreAtom):
         self._repo_index = repo_index
 
     @property
+    def _memo_id(self):
+        # the raw repository is specific to the loaded configuration
+        return (self.__class__, id(self._pkg.repo.raw_repo), self._pkg.cpvstr)
+
+    @memoized_property
     def key(self):
         return PkgCoreBoundPackageKey(self._pkg)
 
@@ -120,35 +126,46 @@ class PkgCorePackage(PMPackage, PkgCoreAtom):
     def eapi(self):
         return str(self._pkg.eapi)
 
-    @property
+    @memoized_property
+    def version(self):
+        return PkgCoreAtom.version.fget(self)
+
+    @memoized_property
     def description(self):
         return PkgCorePackageDescription(self._pkg)
 
-    @property
+    @memoized_property
     def homepages(self):
         return SpaceSepTuple(self._pkg.homepage)
 
-    @property
+    @memoized_property
     def keywords(self):
         return SpaceSepFrozenSet(self._pkg.keywords)
 
-    @property
+    @memoized_property
     def defined_phases(self):
         return SpaceSepFrozenSet(self._pkg.defined_phases)
 
-    @property
+    @memoized_property
     def use(self):
         return PkgCoreUseSet(self._pkg.iuse, self._pkg.use)
 
+    @property
+    def _required_use_string(self):
+        if not self._pkg.eapi.options.has_required_use:
+            return ""
+        # pkgcore discards the raw string once REQUIRED_USE is parsed
+        return self._pkg._raw_pkg._fetch_metadata().get("REQUIRED_USE", "")
+
     @property
     def slot_operator(self):
         return None
 
-    @property
+    @memoized_property
     def slotted_atom(self):
         return PkgCoreAtom(self._pkg.slotted_atom)
 
-    @property
+    @memoized_property
     def unversioned_atom(self):
         return PkgCoreAtom(self._pkg.unversioned_atom)
 
@@ -169,7 +186,7 @@ class PkgCorePackage(PMPackage, PkgCoreAtom):
 
 
 class PkgCoreInstallablePackage(PkgCorePackage, PMInstallablePackage):
-    @property
+    @memoized_property
     def inherits(self):
         try:
             l = self._pkg.data["_eclasses_"]
@@ -178,14 +195,14 @@ class PkgCoreInstallablePackage(PkgCorePackage, PMInstallablePackage):
 
         return SpaceSepFrozenSet(l)
 
-    @property
+    @memoized_property
     def build_dependencies(self):
         try:
             return PkgCorePackageDepSet(self._pkg._raw_pkg.depend, self._pkg)
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg._raw_pkg.depends, self._pkg)
 
-    @property
+    @memoized_property
     def cbuild_build_dependencies(self):
         if self.eapi in (str(x) for x in range(0, 7)):
             return self.build_dependencies
@@ -194,41 +211,41 @@ class PkgCoreInstallablePackage(PkgCorePackage, PMInstallablePackage):
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg._raw_pkg.bdepends, self._pkg)
 
-    @property
+    @memoized_property
     def run_dependencies(self):
         try:
             return PkgCorePackageDepSet(self._pkg._raw_pkg.rdepend, self._pkg)
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg._raw_pkg.rdepends, self._pkg)
 
-    @property
+    @memoized_property
     def post_dependencies(self):
         try:
             return PkgCorePackageDepSet(self._pkg._raw_pkg.pdepend, self._pkg)
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg._raw_pkg.pdepends, self._pkg)
 
-    @property
+    @memoized_property
     def required_use(self):
         return PkgCorePackageDepSet(self._pkg._raw_pkg.required_use, self._pkg)
 
-    @property
+    @memoized_property
     def license(self):
         return PkgCorePackageDepSet(self._pkg._raw_pkg.license, self._pkg)
 
-    @property
+    @memoized_property
     def properties(self):
         return PkgCorePackageDepSet(self._pkg._raw_pkg.properties, self._pkg)
 
-    @property
+    @memoized_property
     def restrict(self):
         return PkgCorePackageDepSet(self._pkg._raw_pkg.restrict, self._pkg)
 
-    @property
+    @memoized_property
     def maintainers(self):
         return PkgCoreMaintainerTuple(self._pkg.maintainers)
 
-    @property
+    @memoized_property
     def repo_masked(self):
         for m in self._pkg.repo.masked:
             if m.match(self._pkg):
@@ -242,7 +259,7 @@ class PkgCoreInstallablePackage(PkgCorePackage, PMInstallablePackage):
 
 
 class PkgCoreInstalledPackage(PkgCorePackage, PMInstalledPackage):
-    @property
+    @memoized_property
     def inherits(self):
         try:
             l = self._pkg.data["INHERITED"]
@@ -251,14 +268,14 @@ class PkgCoreInstalledPackage(PkgCorePackage, PMInstalledPackage):
 
         return SpaceSepFrozenSet(l)
 
-    @property
+    @memoized_property
     def build_dependencies(self):
         try:
             return PkgCorePackageDepSet(self._pkg.depend, self._pkg)
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg.depends, self._pkg)
 
-    @property
+    @memoized_property
     def cbuild_build_dependencies(self):
         if self.eapi in (str(x) for x in range(0, 7)):
             return self.build_dependencies
@@ -267,33 +284,33 @@ class PkgCoreInstalledPackage(PkgCorePackage, PMInstalledPackage):
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg.bdepends, self._pkg)
 
-    @property
+    @memoized_property
     def run_dependencies(self):
         try:
             return PkgCorePackageDepSet(self._pkg.rdepend, self._pkg)
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg.rdepends, self._pkg)
 
-    @property
+    @memoized_property
     def post_dependencies(self):
         try:
             return PkgCorePackageDepSet(self._pkg.pdepend, self._pkg)
         except AttributeError:
             return PkgCorePackageDepSet(self._pkg.pdepends, self._pkg)
 
-    @property
+    @memoized_property
     def required_use(self):
         return PkgCorePackageDepSet(self._pkg.required_use, self._pkg)
 
-    @property
+    @memoized_property
     def license(self):
         return PkgCorePackageDepSet(self._pkg.license, self._pkg)
 
-    @property
+    @memoized_property
     def properties(self):
         return PkgCorePackageDepSet(self._pkg.properties, self._pkg)
 
-    @property
+    @memoized_property
     def restrict(self):
         return PkgCorePackageDepSet(self._pkg.restrict, self._pkg)
 
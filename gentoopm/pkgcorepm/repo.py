@@ -24,6 +24,7 @@ from .pkg import (
     PkgCoreInstallablePackage,
     PkgCoreInstalledPackage,
 )
+from .atom import PkgCoreAtom
 from .filter import transform_filters
 
 
@@ -57,25 +58,37 @@ class PkgCoreRepository(PkgCorePackageSet, PMRepository):
                     "Unknown configurable: {}".format(configurable)
                 )
         self._repo = repo_obj.configure(*args)
+        self._domain = domain
 
     @abstractproperty
     def _pkg_class(self):
         pass
 
     def __iter__(self):
+        idx = self.index
+        if idx is not None:
+            for p in idx:
+                yield p
+            return
+
         index = self._index
         for pkg in self._repo:
             if pkg.package_is_real:
                 yield self._pkg_class(pkg, index)
 
     def filter(self, *args, **kwargs):
+        newargs = [(a if not isinstance(a, str) else PkgCoreAtom(a)) for a in args]
+        pset, kwargs = self._index_filter(newargs, kwargs)
+        if pset is not None:
+            return PkgCoreFilteredPackageSet(pset, newargs, kwargs)
+
         r = self
         filt, newargs, newkwargs = transform_filters(args, kwargs)
 
         if filt:
             r = PkgCoreFilteredRepo(self, filt)
         if newargs or newkwargs:
-            r = PkgCoreFilteredPackageSet(r, args, kwargs)
+            r = PkgCoreFilteredPackageSet(r, newargs, newkwargs)
 
         return r
 
@@ -96,6 +109,11 @@ class PkgCoreFilteredRepo(PkgCoreRepository):
             if pkg.package_is_real:
                 yield self._pkg_class(pkg, index)
 
+    def _explain(self):
+        return ["%s(%s):" % (self.__class__.__name__, self._filt)] + [
+            "  %s" % l for l in self._repo._explain()
+        ]
+
     def filter(self, *args, **kwargs):
         r = self
         filt, newargs, newkwargs = transform_filters(args, kwargs)
@@ -103,7 +121,7 @@ class PkgCoreFilteredRepo(PkgCoreRepository):
         if filt:
             r = PkgCoreFilteredRepo(self._repo, br.AndRestriction(self._filt, filt))
         if newargs or newkwargs:
-            r = PkgCoreFilteredPackageSet(r, args, kwargs)
+            r = PkgCoreFilteredPackageSet(r, newargs, newkwargs)
 
         return r
 
@@ -114,7 +132,6 @@ class PkgCoreEbuildRepo(PkgCoreRepository, PMEbuildRepository, FillMissingCompar
 
     def __init__(self, repo_obj, domain, index):
         PkgCoreRepository.__init__(self, repo_obj, domain)
-        self._domain = domain
         self._index = index
 
     @property
@@ -125,6 +142,15 @@ class PkgCoreEbuildRepo(PkgCoreRepository, PMEbuildRepository, FillMissingCompar
     def path(self):
         return self._repo.location
 
+    @property
+    def _cache_key(self):
+        return (self._domain, self.path)
+
+    def _package_keys(self):
+        for cat, pkgs in self._repo.packages.items():
+            for pkg in pkgs:
+                yield "%s/%s" % (cat, pkg)
+
     @property
     def global_use(self) -> dict[str, GlobalUseFlag]:
         return {
@@ -180,3 +206,7 @@ class PkgCoreEbuildRepo(PkgCoreRepository, PMEbuildRepository, FillMissingCompar
 
 class PkgCoreInstalledRepo(PkgCoreRepository):
     _pkg_class = PkgCoreInstalledPackage
+
+    @property
+    def _cache_key(self):
+        return (self._domain, None)
@@ -18,6 +18,7 @@ class PortagePM(PackageManager):
         return VERSION
 
     def reload_config(self):
+        PackageManager.reload_config(self)
         kwargs = {}
         if self.config_root:
             kwargs["config_root"] = self.config_root
@@ -26,6 +27,7 @@ class PortagePM(PackageManager):
         self._root = max(trees)
         self._vardb = tree["vartree"].dbapi
         self._portdb = tree["porttree"].dbapi
+        self._cache_owners = (self._portdb, self._vardb)
 
     @property
     def repositories(self):
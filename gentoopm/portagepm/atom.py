@@ -6,10 +6,32 @@ import collections
 import portage.exception as pe
 from portage.dbapi.dep_expand import dep_expand
 from portage.dep import match_from_list
-from portage.versions import catsplit, pkgsplit, cpv_getversion, vercmp
-
-from ..basepm.atom import PMAtom, PMPackageKey, PMPackageVersion, PMIncompletePackageKey
+from portage.versions import catsplit, pkgsplit, cpv_getversion
+
+from ..basepm.atom import (
+    PMAtom,
+    PMPackageKey,
+    PMPackageVersion,
+    PMIncompletePackageKey,
+    version_sort_key,
+)
 from ..exceptions import InvalidAtomStringError
+from ..util import LRUCache
+
+_atom_cache = LRUCache(16384)
+
+
+def get_atom_cache():
+    """
+    Get the cache of parsed atoms. Entries are keyed by the atom string,
+    and hold immutable Portage atoms shared by all L{PortageAtom}
+    instances (and packages matched as atoms) with the same string.
+    The C{hits} and C{misses} attributes of the cache can be used
+    to monitor its efficiency.
+
+    @rtype: L{LRUCache}
+    """
+    return _atom_cache
 
 
 class PortagePackageKey(PMPackageKey):
@@ -45,7 +67,7 @@ class PortagePackageVersion(PMPackageVersion):
         return int(rs[1:])
 
     def __lt__(self, other):
-        return vercmp(str(self), str(other)) < 0
+        return self.sort_key < version_sort_key(str(other))
 
 
 class FakeSettings(object):
@@ -59,9 +81,15 @@ class FakeSettings(object):
 
 def _get_atom(s):
     try:
-        return dep_expand(s, settings=FakeSettings())
+        return _atom_cache[s]
+    except KeyError:
+        pass
+    try:
+        a = dep_expand(s, settings=FakeSettings())
     except pe.InvalidAtom:
         raise InvalidAtomStringError("Incorrect atom: %s" % s)
+    _atom_cache[s] = a
+    return a
 
 
 class PortageAtom(object):
@@ -108,6 +136,10 @@ class CompletePortageAtom(PMAtom):
         else:
             return PortagePackageVersion(self._atom.cpv)
 
+    @property
+    def operator(self):
+        return self._atom.operator
+
     @property
     def slot(self):
         return self._atom.slot
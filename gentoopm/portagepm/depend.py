@@ -1,8 +1,10 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import sys
+
 from collections import namedtuple
-from portage.dep import paren_reduce, use_reduce
+from portage.dep import paren_reduce
 
 from ..basepm.depend import (
     PMPackageDepSet,
@@ -13,6 +15,85 @@ from ..basepm.depend import (
     PMAtMostOneOfDep,
     PMBaseDep,
 )
+from ..util import LRUCache
+
+_operators = frozenset(("||", "&&", "??", "__xor__?"))
+_depstring_cache = LRUCache(4096)
+
+
+def get_depstring_cache():
+    """
+    Get the cache of parsed dependency strings. Entries are keyed
+    by the raw dependency string, and hold immutable parse trees shared
+    by all packages using the same string. The C{hits} and C{misses}
+    attributes of the cache can be used to monitor its efficiency.
+
+    @rtype: L{LRUCache}
+    """
+    return _depstring_cache
+
+
+def _freeze(deps):
+    return tuple(
+        _freeze(d) if isinstance(d, list) else sys.intern(d) for d in deps
+    )
+
+
+def _parse_depstring(depstr):
+    """
+    Parse a dependency string into an immutable tree, using the cache
+    if possible.
+
+    @param depstr: the dependency string (with C{^^} replaced)
+    @type depstr: string
+    @return: the parsed tree, as nested tuples
+    @rtype: tuple
+    """
+    try:
+        return _depstring_cache[depstr]
+    except KeyError:
+        pass
+    deps = _freeze(paren_reduce(depstr))
+    _depstring_cache[depstr] = deps
+    return deps
+
+
+def _reduce_conditionals(deps, puse):
+    """
+    Evaluate USE conditionals in a parsed dependency tree.
+
+    @param deps: the parsed tree
+    @type deps: tuple
+    @param puse: enabled USE flags
+    @type puse: frozenset(string)
+    @return: the tree with enabled conditionals inlined and the remaining
+            ones removed, along with the groups left empty by that (like
+            C{use_reduce()} does)
+    @rtype: list
+    """
+    ret = []
+    it = iter(deps)
+    for d in it:
+        if isinstance(d, tuple):
+            sub = tuple(_reduce_conditionals(d, puse))
+            if sub:
+                ret.append(sub)
+        elif d in _operators:
+            sub = tuple(_reduce_conditionals(next(it), puse))
+            if sub:
+                ret.append(d)
+                ret.append(sub)
+        elif d.endswith("?"):
+            sub = next(it)
+            if d.startswith("!"):
+                enabled = d[1:-1] not in puse
+            else:
+                enabled = d[:-1] in puse
+            if enabled:
+                ret.extend(_reduce_conditionals(sub, puse))
+        else:
+            ret.append(d)
+    return ret
 
 
 class PortageBaseDep(PMBaseDep):
@@ -23,8 +104,8 @@ class PortageBaseDep(PMBaseDep):
     def __iter__(self):
         it = iter(self._deps)
         for d in it:
-            if isinstance(d, list):
-                yield PortageAllOfDep(it, self._args)
+            if isinstance(d, tuple):
+                yield PortageAllOfDep(d, self._args)
             elif d == "||":
                 yield PortageAnyOfDep(next(it), self._args)
             elif d == "&&":
@@ -58,11 +139,20 @@ class PortageAtMostOneOfDep(PMAtMostOneOfDep, PortageBaseDep):
 class PortageConditionalUseDep(PMConditionalDep, PortageBaseDep):
     def __init__(self, deps, args, flag):
         PortageBaseDep.__init__(self, deps, args)
-        self._flag = flag
+        self._negated = flag.startswith("!")
+        self._flag = flag.lstrip("!")
 
     @property
     def enabled(self):
-        return self._flag in self._args.puse
+        return (self._flag in self._args.puse) != self._negated
+
+    @property
+    def flag(self):
+        return self._flag
+
+    @property
+    def negated(self):
+        return self._negated
 
 
 _argtuple = namedtuple("PortageDepArgTuple", ("puse", "cls"))
@@ -70,7 +160,6 @@ _argtuple = namedtuple("PortageDepArgTuple", ("puse", "cls"))
 
 class PortagePackageDepSet(PMPackageDepSet, PortageBaseDep):
     def __init__(self, s, *args):
-        self._use_reducable = not "^^" in s
         # ARGV, paren_reduce() doesn't handle ^^
         # so we hack it to a __xor__?, UGLY!
         self._depstr = s.replace("^^", "__xor__?")
@@ -78,16 +167,16 @@ class PortagePackageDepSet(PMPackageDepSet, PortageBaseDep):
 
     def __iter__(self):
         if self._deps is None:
-            self._deps = paren_reduce(self._depstr)
+            self._deps = _parse_depstring(self._depstr)
         return PortageBaseDep.__iter__(self)
 
     @property
     def without_conditionals(self):
-        if self._use_reducable:
-            return PortageUncondAllOfDep(
-                use_reduce(self._depstr, self._args.puse), self._args
-            )
-        return PMPackageDepSet.without_conditionals.fget(self)
+        if self._deps is None:
+            self._deps = _parse_depstring(self._depstr)
+        return PortageUncondAllOfDep(
+            _reduce_conditionals(self._deps, self._args.puse), self._args
+        )
 
 
 class PortageUncondDep(PortageBaseDep):
@@ -98,7 +187,9 @@ class PortageUncondDep(PortageBaseDep):
     def __iter__(self):
         it = iter(self._deps)
         for d in it:
-            if d == "||":
+            if isinstance(d, tuple):
+                yield PortageUncondAllOfDep(d, self._args)
+            elif d == "||":
                 yield PortageUncondAnyOfDep(next(it), self._args)
             elif d == "&&":
                 yield PortageUncondAllOfDep(next(it), self._args)
@@ -4,9 +4,10 @@
 import errno
 import os.path
 
-from portage.versions import cpv_getkey
+from portage.versions import cpv_getkey, cpv_getversion
 from portage.xml.metadata import MetaDataXML
 
+from ..basepm.atom import version_sort_key
 from ..basepm.depend import PMRequiredUseAtom
 from ..basepm.pkg import (
     PMPackage,
@@ -17,8 +18,10 @@ from ..basepm.pkg import (
     PMPackageState,
     PMUseFlag,
     PMPackageMaintainer,
+    memoized_property,
 )
 from ..basepm.pkgset import PMPackageSet, PMFilteredPackageSet
+from ..basepm.snapshot import get_repository_snapshot
 from ..util import SpaceSepTuple, SpaceSepFrozenSet
 
 from .atom import (
@@ -64,7 +67,7 @@ class PortagePackageDescription(PMPackageDescription):
 
     @property
     def short(self):
-        return self._pkg._aux_get("DESCRIPTION")
+        return self._pkg._description
 
     @property
     def long(self):
@@ -121,80 +124,110 @@ class PortageDBCPV(PMPackage, CompletePortageAtom):
     def __init__(self, cpv, dbapi):
         self._cpv = cpv
         self._dbapi = dbapi
+        self._aux_cache = {}
+        self._split_slot_cache = None
+
+    @property
+    def _memo_id(self):
+        return (self.__class__, id(self._dbapi), self._cpv)
 
     @property
     def path(self):
         # .findname() gives .ebuild path
         return self._dbapi.getpath(self._cpv)
 
+    @memoized_property
+    def _cp(self):
+        return cpv_getkey(self._cpv)
+
     @property
     def key(self):
-        return PortageBoundPackageKey(cpv_getkey(self._cpv), self)
+        return PortageBoundPackageKey(self._cp, self)
 
-    @property
+    @memoized_property
     def version(self):
         return PortagePackageVersion(self._cpv)
 
+    def _aux_query(self, keys):
+        return self._dbapi.aux_get(self._cpv, keys)
+
     def _aux_get(self, *keys):
-        val = map(str, self._dbapi.aux_get(self._cpv, keys))
+        # fetch all missing keys in a single query and remember them
+        missing = [k for k in keys if k not in self._aux_cache]
+        if missing:
+            vals = self._aux_query(missing)
+            self._aux_cache.update(zip(missing, map(str, vals)))
         if len(keys) == 1:
-            return next(iter(val))
+            return self._aux_cache[keys[0]]
         else:
-            return tuple(val)
+            return tuple(self._aux_cache[k] for k in keys)
+
+    def _prefetch(self, keys):
+        self._aux_get(*keys)
 
     @property
     def eapi(self):
         return self._aux_get("EAPI")
 
+    @memoized_property
+    def _description(self):
+        return self._aux_get("DESCRIPTION")
+
     @property
     def description(self):
         return PortagePackageDescription(self)
 
-    @property
+    @memoized_property
     def inherits(self):
         return SpaceSepFrozenSet(self._aux_get("INHERITED"))
 
-    @property
+    @memoized_property
     def defined_phases(self):
         v = self._aux_get("DEFINED_PHASES")
         if v == "-":
             return SpaceSepFrozenSet(())
         return SpaceSepFrozenSet(v)
 
-    @property
+    @memoized_property
     def homepages(self):
         return SpaceSepTuple(self._aux_get("HOMEPAGE"))
 
-    @property
+    @memoized_property
     def keywords(self):
         return SpaceSepFrozenSet(self._aux_get("KEYWORDS"))
 
+    @property
+    def _split_slot(self):
+        if self._split_slot_cache is None:
+            split_slot = self._aux_get("SLOT").split("/")
+            assert len(split_slot) <= 2
+            self._split_slot_cache = split_slot
+        return self._split_slot_cache
+
     @property
     def slot(self):
-        return self._aux_get("SLOT").split("/")[0]
+        return self._split_slot[0]
 
     @property
     def subslot(self):
-        split_slot = self._aux_get("SLOT").split("/")
-        assert len(split_slot) <= 2
         # subslot defaults to slot if not explicitly provided
-        return split_slot[-1]
+        return self._split_slot[-1]
 
     @property
     def repository(self):
         raise None
 
-    @property
+    @memoized_property
     def use(self):
         return PortageUseSet(self._aux_get("IUSE").split(), self._applied_use)
 
-    @property
+    @memoized_property
     def slotted_atom(self):
         cp = str(self.key)
         slot = self.slot
         return PortageAtom("%s:%s" % (cp, slot))
 
-    @property
+    @memoized_property
     def unversioned_atom(self):
         return PortageAtom(str(self.key))
 
@@ -202,7 +235,7 @@ class PortageDBCPV(PMPackage, CompletePortageAtom):
     def _atom(self):
         return _get_atom(str(self))
 
-    @property
+    @memoized_property
     def _applied_use(self):
         class LazyUseGetter(object):
             def __init__(self, dbapi, cpv):
@@ -228,13 +261,13 @@ class PortageDBCPV(PMPackage, CompletePortageAtom):
 
         return LazyUseGetter(self._dbapi, self._cpv)
 
-    @property
+    @memoized_property
     def build_dependencies(self):
         return PortagePackageDepSet(
             self._aux_get("DEPEND"), self._applied_use, PortageAtom
         )
 
-    @property
+    @memoized_property
     def cbuild_build_dependencies(self):
         if self.eapi in (str(x) for x in range(0, 7)):
             return self.build_dependencies
@@ -242,37 +275,41 @@ class PortageDBCPV(PMPackage, CompletePortageAtom):
             self._aux_get("BDEPEND"), self._applied_use, PortageAtom
         )
 
-    @property
+    @memoized_property
     def run_dependencies(self):
         return PortagePackageDepSet(
             self._aux_get("RDEPEND"), self._applied_use, PortageAtom
         )
 
-    @property
+    @memoized_property
     def post_dependencies(self):
         return PortagePackageDepSet(
             self._aux_get("PDEPEND"), self._applied_use, PortageAtom
         )
 
-    @property
+    @memoized_property
     def required_use(self):
         return PortagePackageDepSet(
             self._aux_get("REQUIRED_USE"), self._applied_use, PMRequiredUseAtom
         )
 
     @property
+    def _required_use_string(self):
+        return self._aux_get("REQUIRED_USE")
+
+    @memoized_property
     def license(self):
         return PortagePackageDepSet(
             self._aux_get("LICENSE"), self._applied_use, str
         )
 
-    @property
+    @memoized_property
     def properties(self):
         return PortagePackageDepSet(
             self._aux_get("PROPERTIES"), self._applied_use, str
         )
 
-    @property
+    @memoized_property
     def restrict(self):
         return PortagePackageDepSet(
             self._aux_get("RESTRICT"), self._applied_use, str
@@ -281,15 +318,16 @@ class PortageDBCPV(PMPackage, CompletePortageAtom):
     def __str__(self):
         return "=%s" % self._cpv
 
+    @property
+    def _sort_key(self):
+        return (cpv_getkey(self._cpv), version_sort_key(cpv_getversion(self._cpv)))
+
     def __lt__(self, other):
         if not isinstance(other, PortageDBCPV):
             raise TypeError("Unable to compare %s against %s" % (self, other))
 
-        if self.key < other.key:
-            return True
-        if self.key == other.key:
-            return self.version < other.version
-        return False
+        # compare key and version only
+        return self._sort_key[:2] < other._sort_key[:2]
 
 
 class PortageCPV(PortageDBCPV, PMInstallablePackage):
@@ -299,14 +337,18 @@ class PortageCPV(PortageDBCPV, PMInstallablePackage):
         self._repo_prio = repo_prio
 
     @property
+    def _memo_id(self):
+        return (self.__class__, id(self._dbapi), self._cpv, self._tree)
+
+    @memoized_property
     def path(self):
         return self._dbapi.findname(self._cpv, self._tree)
 
-    @property
+    @memoized_property
     def repository(self):
         return self._dbapi.getRepositoryName(self._tree)
 
-    @property
+    @memoized_property
     def maintainers(self):
         # yes, seriously, the only API portage has is direct parser
         # for the XML file
@@ -324,28 +366,33 @@ class PortageCPV(PortageDBCPV, PMInstallablePackage):
     def repo_masked(self):
         raise NotImplementedError(".repo_masked is not implemented for Portage")
 
-    def _aux_get(self, *keys):
-        val = map(str, self._dbapi.aux_get(self._cpv, keys, mytree=self._tree))
-        if len(keys) == 1:
-            return next(iter(val))
-        else:
-            return tuple(val)
+    def _aux_query(self, keys):
+        snap = get_repository_snapshot((self._dbapi, self._tree))
+        meta = snap.get(self._cpv) if snap is not None else None
+        if meta is None:
+            return self._dbapi.aux_get(self._cpv, keys, mytree=self._tree)
+
+        rest = [k for k in keys if k not in meta]
+        if rest:
+            vals = self._dbapi.aux_get(self._cpv, rest, mytree=self._tree)
+            meta.update(zip(rest, vals))
+        return [meta[k] for k in keys]
+
+    def _snapshot_entry(self, keys):
+        return (self._cpv, self._aux_get(*keys))
 
     def __str__(self):
         return "=%s::%s" % (self._cpv, self.repository)
 
+    @property
+    def _sort_key(self):
+        return PortageDBCPV._sort_key.fget(self) + (self._repo_prio,)
+
     def __lt__(self, other):
         if not isinstance(other, PortageCPV):
             raise TypeError("Unable to compare %s against %s" % (self, other))
 
-        if self.key < other.key:
-            return True
-        if self.key == other.key:
-            if self.version < other.version:
-                return True
-            if self.version == other.version:
-                return self._repo_prio < other._repo_prio
-        return False
+        return self._sort_key < other._sort_key
 
 
 class PortageVDBCPV(PortageDBCPV, PMInstalledPackage):
@@ -7,12 +7,13 @@ import typing
 
 from abc import abstractproperty
 
-import portage.exception as pe
 from portage.versions import catsplit
 
+from ..basepm.filter import pop_key_filter
 from ..basepm.repo import (PMRepositoryDict, PMEbuildRepository, PMRepository,
                            UseExpand, GlobalUseFlag,
                            )
+from ..exceptions import InvalidAtomStringError
 from ..util import FillMissingComparisons
 
 from .atom import PortageAtom, CompletePortageAtom
@@ -48,10 +49,14 @@ class PortageRepoDict(PMRepositoryDict):
 
 
 class PortageFilteredDBRepo(PortageFilteredPackageSet):
+    _names = None
+
     def __init__(self, repo, atom):
         self._dbapi = repo._dbapi
         self._pkg_class = repo._pkg_class
         self._atom = atom._atom
+        if not atom.complete:
+            self._names = repo.package_names
 
     @property
     def _stringified_atom(self):
@@ -59,16 +64,23 @@ class PortageFilteredDBRepo(PortageFilteredPackageSet):
         return a.replace("null/", "")
 
     def __iter__(self):
-        a = self._stringified_atom
-        try:
-            it = self._dbapi.match(a)
-        except pe.AmbiguousPackageName as e:
-            for pkgcand in e.args[0]:
-                for p in PortageHackedFilteredDBRepo(self, pkgcand):
+        if self._names is not None:
+            # expand the unqualified atom using the package name index
+            for key in self._names.keys(catsplit(self._atom.cp)[1]):
+                for p in PortageHackedFilteredDBRepo(self, key):
                     yield p
-        else:
-            for p in it:
-                yield self._pkg_class(p, self._dbapi)
+            return
+
+        for p in self._dbapi.match(self._stringified_atom):
+            yield self._pkg_class(p, self._dbapi)
+
+    def _explain(self):
+        ret = "%s(%s)" % (self.__class__.__name__, repr(self._stringified_atom))
+        if self._names is not None:
+            ret += " expanded to %s" % ", ".join(
+                self._names.keys(catsplit(self._atom.cp)[1])
+            )
+        return [ret]
 
 
 class PortageHackedFilteredDBRepo(PortageFilteredDBRepo):
@@ -87,6 +99,10 @@ class PortDBRepository(PortagePackageSet, PMRepository):
     def __init__(self, dbapi):
         self._dbapi = dbapi
 
+    @property
+    def _cache_key(self):
+        return (self._dbapi, None)
+
     @abstractproperty
     def _pkg_class(self):
         pass
@@ -95,19 +111,35 @@ class PortDBRepository(PortagePackageSet, PMRepository):
         for p in self._dbapi.cpv_all():  # XXX
             yield self._pkg_class(p, self._dbapi)
 
+    def _package_keys(self):
+        return self._dbapi.cp_all()
+
     _filtered_subclass = PortageFilteredDBRepo
 
     def filter(self, *args, **kwargs):
+        args = [(a if not isinstance(a, str) else PortageAtom(a)) for a in args]
+        pset, kwargs = self._index_filter(args, kwargs)
+        if pset is not None:
+            return PortageFilteredPackageSet(pset, args, kwargs)
+
         newargs = []
         filt = None
         for a in args:
-            if isinstance(a, str):
-                a = PortageAtom(a)
             if isinstance(a, CompletePortageAtom) and filt is None:
                 filt = a
             else:
                 newargs.append(a)
 
+        if filt is None:
+            key, newkwargs = pop_key_filter(kwargs)
+            if key is not None:
+                try:
+                    filt = PortageAtom(key)
+                except InvalidAtomStringError:
+                    pass
+                else:
+                    kwargs = newkwargs
+
         pset = self
         if filt:
             pset = self._filtered_subclass(pset, filt)
@@ -131,20 +163,27 @@ class PortageFilteredRepo(PortageFilteredDBRepo):
         else:
             a = "%s::%s" % (self._stringified_atom, self._name)
 
-        try:
-            it = self._dbapi.xmatch("match-all", a)
-        except pe.AmbiguousPackageName as e:
-            try:
-                candidates = e.args[0]
-            except IndexError:  # pypy?
-                candidates = e.value
-
-            for pkgcand in candidates:
-                for p in PortageHackedFilteredRepo(self, pkgcand):
+        if self._names is not None:
+            # expand the unqualified atom using the package name index
+            for key in self._names.keys(catsplit(self._atom.cp)[1]):
+                for p in PortageHackedFilteredRepo(self, key):
                     yield p
-        else:
-            for p in it:
-                yield self._pkg_class(p, self._dbapi, self._path, self._prio)
+            return
+
+        for p in self._dbapi.xmatch("match-all", a):
+            yield self._pkg_class(p, self._dbapi, self._path, self._prio)
+
+    def _explain(self):
+        ret = "%s(%s, repo=%s)" % (
+            self.__class__.__name__,
+            repr(self._stringified_atom),
+            repr(self._name),
+        )
+        if self._names is not None:
+            ret += " expanded to %s" % ", ".join(
+                self._names.keys(catsplit(self._atom.cp)[1])
+            )
+        return [ret]
 
 
 class PortageHackedAtom(object):
@@ -185,8 +224,20 @@ class PortageRepository(PortDBRepository, PMEbuildRepository, FillMissingCompari
     _pkg_class = PortageCPV
 
     def __iter__(self):
+        idx = self.index
+        if idx is not None:
+            for p in idx:
+                yield p
+            return
+
         path = self.path
         prio = self._repo.priority
+        snap = self.snapshot
+        if snap is not None:
+            for p in snap:
+                yield self._pkg_class(p, self._dbapi, path, prio)
+            return
+
         for cp in self._dbapi.cp_all(trees=(path,)):
             for p in self._dbapi.cp_list(cp, mytree=path):
                 yield self._pkg_class(p, self._dbapi, path, prio)
@@ -201,6 +252,13 @@ class PortageRepository(PortDBRepository, PMEbuildRepository, FillMissingCompari
     def path(self):
         return self._repo.location
 
+    @property
+    def _cache_key(self):
+        return (self._dbapi, self.path)
+
+    def _package_keys(self):
+        return self._dbapi.cp_all(trees=(self.path,))
+
     @property
     def use_expand(self) -> dict[str, UseExpand]:
         def inner() -> typing.Generator[tuple[str, UseExpand], None, None]:
@@ -190,7 +190,7 @@ class PMQueryCommands(object):
 
                 pkgs = pm.stack.filter(a)
                 if args.best_in_slot:
-                    pkgs = [pg.best for pg in pkgs.group_by("slotted_atom")]
+                    pkgs = pkgs.best_by("slotted_atom")
                 if args.best:
                     try:
                         pkgs = (pkgs.best,)
@@ -203,6 +203,22 @@ class PMQueryCommands(object):
                 for p in pkgs:
                     print(args.format.format(**AtomFormatDict(p)))
 
+    class complete(PMQueryCommand):
+        """
+        Print package names, categories and keys starting with the specified
+        prefix, for shell completion.
+        """
+
+        def __init__(self, argparser):
+            PMQueryCommand.__init__(self, argparser)
+            argparser.add_argument(
+                "prefix", nargs="?", default="", help="The text to complete"
+            )
+
+        def __call__(self, pm, args):
+            for c in pm.stack.package_names.complete(args.prefix):
+                print(c)
+
     # === shell ===
 
     class shell(PMQueryCommand):
@@ -263,6 +279,12 @@ class PMQueryCLI(object):
             help="Use a specific package manager",
             choices=all_pms,
         )
+        arg.add_argument(
+            "--snapshot-dir",
+            action="store",
+            help="Serve repository metadata from on-disk snapshots stored "
+            "in the specified directory (built if missing or out-of-date)",
+        )
 
         subp = arg.add_subparsers(title="Sub-commands", required=True)
         for cmd_name, cmd_help, cmd_class in PMQueryCommands():
@@ -282,6 +304,15 @@ class PMQueryCLI(object):
             except Exception:
                 arg.error("No working package manager could be found.")
 
+        if args.snapshot_dir is not None:
+            for r in pm.repositories:
+                try:
+                    r.load_snapshot(args.snapshot_dir)
+                except NotImplementedError:
+                    arg.error("--snapshot-dir is not supported by %s" % pm.name)
+                except OSError as e:
+                    arg.error("Unable to load repository snapshot: %s" % e)
+
         return args.instance(pm, args) or 0
 
 
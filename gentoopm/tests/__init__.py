@@ -32,6 +32,9 @@ class PackageNames:
     nonpmasked = "=a/pmasked-1"
     """ Atom matching a non-p.masked package. """
 
+    depending = "a/depender"
+    """ Atom matching a package with conditional dependencies. """
+
     repository = "gentoo"
     """ Repository name guaranteed to match. """
 
@@ -40,3 +40,13 @@ def pm(request, test_env):
         return get_pm(request.param)
     except ImportError as e:
         pytest.skip(f"PM not found: {e}")
+
+
+@pytest.fixture
+def other_pm(pm, tmp_path):
+    """A second instance of the PM, with a different USE configuration."""
+    root = tmp_path / "root"
+    shutil.copytree(os.environ["PORTAGE_CONFIGROOT"], root, symlinks=True)
+    with (root / "etc/portage/make.conf").open("a") as f:
+        f.write("USE='example-flag'\n")
+    return type(pm)(str(root))
@@ -1,6 +1,8 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import importlib
+
 import pytest
 
 from gentoopm.exceptions import InvalidAtomStringError
@@ -167,3 +169,87 @@ def test_unqualified_atom_slots(pm):
     assert e.slot == "1"
     assert e.subslot is None
     assert e.slot_operator is None
+
+
+@pytest.mark.parametrize(
+    "lower,higher",
+    [
+        ("1.0", "1.0-r1"),
+        ("1.0_alpha", "1.0_beta"),
+        ("1.0_beta2", "1.0_pre"),
+        ("1.0_rc1", "1.0"),
+        ("1.0", "1.0_p1"),
+        ("1.0_alpha_p", "1.0_alpha1"),
+        ("1.0", "1.0a"),
+        ("1.2", "1.10"),
+        ("1.01", "1.1"),
+        ("1.2", "1.2.0"),
+        ("1.0z", "1.0.1"),
+    ],
+)
+def test_version_sort_key(pm, lower, higher):
+    lv = pm.Atom(f"=app-foo/bar-{lower}").version
+    hv = pm.Atom(f"=app-foo/bar-{higher}").version
+    assert lv.sort_key < hv.sort_key
+    assert lv < hv
+    assert not hv < lv
+
+
+@pytest.mark.parametrize("a,b", [("1.010", "1.01"), ("1.0-r0", "1.0")])
+def test_version_sort_key_equal(pm, a, b):
+    av = pm.Atom(f"=app-foo/bar-{a}").version
+    bv = pm.Atom(f"=app-foo/bar-{b}").version
+    assert av.sort_key == bv.sort_key
+
+
+def test_atom_cache(pm):
+    cache = importlib.import_module(f"gentoopm.{pm.name}pm.atom").get_atom_cache()
+    cache.clear()
+    a = pm.Atom(PackageNames.single_complete)
+    misses, hits = cache.misses, cache.hits
+    b = pm.Atom(PackageNames.single_complete)
+    assert cache.misses == misses
+    assert cache.hits == hits + 1
+    assert str(a) == str(b)
+    with pytest.raises(InvalidAtomStringError):
+        pm.Atom("<>foo-11")
+
+
+def test_atom_cache_rdepend_matching(pm):
+    """Match every RDEPEND atom in the repository against all packages."""
+    cache = importlib.import_module(f"gentoopm.{pm.name}pm.atom").get_atom_cache()
+    pkgs = list(pm.stack)
+
+    def _match_all():
+        ret = []
+        for p in pkgs:
+            for dep in p.run_dependencies:
+                if hasattr(dep, "key"):
+                    atom = pm.Atom(str(dep).lstrip("!"))
+                    ret.append(sorted(str(q) for q in pkgs if q in atom))
+        return ret
+
+    first = _match_all()
+    assert ["=a/pmasked-1", "=a/pmasked-2"] in [
+        [s.split("::")[0] for s in l] for l in first
+    ]
+    misses = cache.misses
+    assert _match_all() == first
+    assert cache.misses == misses
+
+
+@pytest.mark.parametrize(
+    "atom,operator",
+    [
+        ("foo/bar", None),
+        (">=foo/bar-1", ">="),
+        ("<foo/bar-1:0", "<"),
+        ("~foo/bar-1", "~"),
+        ("=foo/bar-1*", "=*"),
+        ("bar", None),
+        (">bar-1", ">"),
+        ("=bar-1*", "=*"),
+    ],
+)
+def test_atom_operator(pm, atom, operator):
+    assert pm.Atom(atom).operator == operator
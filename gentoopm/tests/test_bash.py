@@ -3,9 +3,23 @@
 
 import pytest
 
+import asyncio
+import bz2
 import io
+import re
+import subprocess
 
-from gentoopm.bash.bashserver import BashServer
+from concurrent.futures import ThreadPoolExecutor
+
+from gentoopm.basepm.environ import (
+    BashParserPool,
+    PMPackageEnvironment,
+    get_async_environ_pool,
+    get_environ_cache,
+)
+from gentoopm.bash.bashserver import AsyncBashServer, BashServer
+from gentoopm.bash.declare import DeclareParser
+from gentoopm.exceptions import InvalidBashCodeError, UnsupportedBashCodeError
 
 
 @pytest.fixture
@@ -54,6 +68,40 @@ test_function() {
     assert bash_server("test_function") == 42
 
 
+def test_eval_many(bash_server):
+    bash_server.load_file(
+        io.BytesIO(
+            BASIC_DATA
+            + b"""
+test_function() {
+    return 42
+}
+"""
+        )
+    )
+    codes = [
+        "declare -f test_function",
+        "declare -f nonexistent_function",
+        "test_function",
+        "[[ ${VAR2} == 'test test' ]]",
+        "echo 'multi'\necho \"line\" \\\n  cont\nexit 3",
+        "printf '%s\\n\\n' \"${VAR1}\" zażółć",
+        "cat",
+    ]
+    assert bash_server.eval_many(codes) == [0, 1, 42, 0, 3, 0, 0]
+    assert bash_server.eval_many(codes, capture=True) == [
+        (0, "test_function () \n{ \n    return 42\n}\n"),
+        (1, ""),
+        (42, ""),
+        (0, ""),
+        (3, "multi\nline cont\n"),
+        (0, "test\n\nzażółć\n\n"),
+        (0, ""),
+    ]
+    assert bash_server.eval_many([]) == []
+    assert bash_server["VAR1"] == "test"
+
+
 def test_random_output(bash_server):
     """Test that random output is discarded correctly"""
     bash_server.load_file(
@@ -66,3 +114,301 @@ TEST=test
         )
     )
     assert bash_server["TEST"] == "test"
+
+
+def test_copy_many(bash_server):
+    """Test reading many variables from a real environment file"""
+    path = "test-root/var/db/pkg/a/single-1/environment.bz2"
+    with bz2.open(path) as f:
+        data = f.read()
+    names = re.findall(rb"^declare -[-x] ([A-Z_]+)=", data, re.M)
+    names = [n.decode() for n in names]
+    names += ["UNSET_VAR%d" % i for i in range(100 - len(names))]
+    assert len(names) == 100
+
+    bash_server.load_file(io.BytesIO(data))
+    env = bash_server.copy(*names)
+    assert len(env) == 100
+    assert env["CATEGORY"] == "a"
+    assert env["EAPI"] == "4"
+    assert env["UNSET_VAR0"] == ""
+    # the server must remain in sync after the batch
+    assert bash_server["DESCRIPTION"] == "A installable test ebuild"
+
+
+def test_large_value(bash_server):
+    value = "x" * 1000000
+    bash_server.load_file(io.BytesIO(b"BIG=%s\nSMALL=y\n" % value.encode()))
+    assert bash_server.copy("BIG", "SMALL") == {"BIG": value, "SMALL": "y"}
+    assert bash_server.copy() == {}
+    assert bash_server["SMALL"] == "y"
+
+
+def test_parser_pool(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"env{i}"
+        path.write_text(f"VAR={i}\n")
+        paths.append(str(path))
+
+    pool = BashParserPool(2)
+    try:
+        with pool.parser(paths[0]) as bp0:
+            assert bp0["VAR"] == "0"
+            with pool.parser(paths[1]) as bp1:
+                assert bp1 is not bp0
+                assert bp1["VAR"] == "1"
+        # parsers are reused for the file they have loaded
+        with pool.parser(paths[0]) as bp:
+            assert bp is bp0
+        with pool.parser(paths[1]) as bp:
+            assert bp is bp1
+
+        def query(i):
+            with pool.parser(paths[i % 4]) as bp:
+                return bp["VAR"]
+
+        with ThreadPoolExecutor(8) as executor:
+            assert list(executor.map(query, range(40))) == [
+                str(i % 4) for i in range(40)
+            ]
+        assert pool._count <= 2
+    finally:
+        pool.terminate()
+
+
+GENERATE_ENV_SCRIPT = r"""
+X_PLAIN="plain value"
+X_QUOTES='a "b" \c $d `e` ${f}'
+X_NEWLINE=$'line 1\nline 2'
+X_CTRL=$'a\x01b\tc\033'
+X_UTF8='zażółć gęślą jaźń'
+X_EMPTY=
+X_BRACE="}"
+declare -i X_INT=42
+declare -a X_ARR=(a "b c")
+declare -A X_ASSOC=([k]=v)
+declare -n X_REF=X_PLAIN
+declare -l X_LOWER=ABC
+declare -u X_UPPER=abc
+declare -r X_RO=ro
+export X_EXP=exp
+declare -x X_UNSET_EXPORTED
+f() {
+    cat <<-EOF
+}
+	EOF
+    echo "}"
+    (( x = 1 << 2 ))
+}
+g() {
+    :
+}
+declare -p ${!X_*}
+declare -f
+"""
+
+
+def declare_names(data):
+    return re.findall(r"^declare -\S+ ([A-Za-z_][A-Za-z0-9_]*)", data, re.M)
+
+
+def compare_declare_parser(bash_server, data):
+    """Compare DeclareParser results against bash, return the parser"""
+    parser = DeclareParser()
+    parser.load_file(io.BytesIO(data))
+    bash_server.load_file(io.BytesIO(data))
+    names = declare_names(data.decode()) + ["X_NONEXISTENT"]
+    for name in names:
+        if parser.supports(name):
+            assert parser[name] == bash_server[name], name
+    return parser
+
+
+def test_declare_parser_environment(bash_server):
+    path = "test-root/var/db/pkg/a/single-1/environment.bz2"
+    with bz2.open(path) as f:
+        data = f.read()
+    parser = compare_declare_parser(bash_server, data)
+    assert parser["CATEGORY"] == "a"
+    assert parser["FETCHCOMMAND_SSH"] == bash_server["FETCHCOMMAND_SSH"]
+    assert not parser.supports("PATH")
+
+
+def test_declare_parser_generated(bash_server):
+    data = subprocess.run(
+        ["bash", "-c", GENERATE_ENV_SCRIPT],
+        check=True,
+        env={},
+        stdout=subprocess.PIPE,
+    ).stdout
+    parser = compare_declare_parser(bash_server, data)
+    for name in (
+        "X_PLAIN",
+        "X_QUOTES",
+        "X_NEWLINE",
+        "X_CTRL",
+        "X_UTF8",
+        "X_EMPTY",
+        "X_BRACE",
+        "X_INT",
+        "X_LOWER",
+        "X_UPPER",
+        "X_RO",
+        "X_EXP",
+        "X_UNSET_EXPORTED",
+        "X_NONEXISTENT",
+    ):
+        assert parser.supports(name), name
+    for name in ("X_ARR", "X_ASSOC", "X_REF", "UID", "BASH_VERSION"):
+        assert not parser.supports(name), name
+        with pytest.raises(UnsupportedBashCodeError):
+            parser[name]
+
+
+def test_declare_parser_unsupported():
+    with pytest.raises(UnsupportedBashCodeError):
+        DeclareParser().load_file(io.BytesIO(BASIC_DATA))
+
+
+def test_environ_cache(tmp_path):
+    path = tmp_path / "environment.bz2"
+    path.write_bytes(bz2.compress(b'declare -x VAR="1"\nVAR2=foo\n'))
+    env = PMPackageEnvironment(str(path))
+    cache = get_environ_cache()
+
+    misses = cache.misses
+    assert env["VAR"] == "1"
+    assert cache.misses == misses + 1
+    hits = cache.hits
+    assert env.copy("VAR", "VAR2") == {"VAR": "1", "VAR2": "foo"}
+    assert env["VAR2"] == "foo"
+    assert cache.hits > hits
+    assert cache.misses == misses + 1
+
+    # modifying the file invalidates the cached contents
+    path.write_bytes(bz2.compress(b'declare -x VAR="22"\n'))
+    assert env["VAR"] == "22"
+    assert env["VAR2"] == ""
+    assert cache.misses == misses + 2
+
+
+def test_invalid_code(bash_server):
+    with pytest.raises(InvalidBashCodeError):
+        bash_server.load_file(io.BytesIO(b"VAR=1\nif then\n"))
+    # the server remains usable, and nothing has been executed
+    bash_server.load_file(io.BytesIO(b"VAR2=2"))
+    assert bash_server.copy("VAR", "VAR2") == {"VAR": "", "VAR2": "2"}
+    bash_server.load_file(io.BytesIO(b""))
+    assert bash_server["VAR2"] == ""
+
+
+def test_invalid_code_not_run(bash_server, tmp_path):
+    out = tmp_path / "out"
+    # code escaping a function wrapper must not run during the check
+    with pytest.raises(InvalidBashCodeError):
+        bash_server.load_file(
+            io.BytesIO(b"}; echo x >> '%s'; f() { :" % str(out).encode())
+        )
+    assert not out.exists()
+    bash_server.load_file(io.BytesIO(b"echo x >> '%s'" % str(out).encode()))
+    assert out.read_text() == "x\n"
+
+
+def test_large_code(bash_server, tmp_path):
+    out = tmp_path / "out"
+    # larger than the pipe buffer
+    value = "x" * 100000
+    bash_server.load_file(io.BytesIO(b"VAR='%s'\nVAR2=2\n" % value.encode()))
+    assert bash_server.copy("VAR", "VAR2") == {"VAR": value, "VAR2": "2"}
+    with pytest.raises(InvalidBashCodeError):
+        bash_server.load_file(
+            io.BytesIO(
+                b"VAR3='%s'; }; echo x >> '%s'; f() { :"
+                % (value.encode(), str(out).encode())
+            )
+        )
+    assert not out.exists()
+    assert bash_server["VAR3"] == ""
+
+
+def test_async_server():
+    async def run():
+        server = AsyncBashServer()
+        await server.start()
+        try:
+            await server.load_file(io.BytesIO(BASIC_DATA))
+            assert await server.get("VAR2") == "test test"
+            assert await server.copy("VAR1", "VAR3") == {
+                "VAR1": "test",
+                "VAR3": "test",
+            }
+            assert await server.run("[[ ${VAR4} == test ]]") == 0
+            # concurrent queries are pipelined
+            results = await asyncio.gather(
+                *(server.get("VAR%d" % (i % 4 + 1)) for i in range(100))
+            )
+            assert results == [
+                "test test" if i % 4 == 1 else "test" for i in range(100)
+            ]
+            with pytest.raises(InvalidBashCodeError):
+                await server.load_file(io.BytesIO(b"if then\n"))
+        finally:
+            await server.terminate()
+
+    asyncio.run(run())
+
+
+def test_async_environ(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"env{i}"
+        path.write_text(f'declare -x VAR="{i}"\ndeclare -a ARR=([0]="a{i}")\n')
+        paths.append(str(path))
+
+    async def query(env):
+        return (
+            await env.get("VAR"),
+            await env.copy("ARR", "VAR"),
+            await env.run("false"),
+        )
+
+    async def run():
+        pool = get_async_environ_pool()
+        pool.maxsize = 2
+        try:
+            envs = [PMPackageEnvironment(paths[i % 3]).as_async() for i in range(30)]
+            results = await asyncio.gather(*(query(env) for env in envs))
+            assert results == [
+                (str(i % 3), {"ARR": f"a{i % 3}", "VAR": str(i % 3)}, 1)
+                for i in range(30)
+            ]
+        finally:
+            await pool.terminate()
+
+    asyncio.run(run())
+
+
+def test_fork(bash_server):
+    bash_server.load_file(
+        io.BytesIO(BASIC_DATA + b"test_function() { return 42; }\n")
+    )
+    forks = [bash_server.fork() for i in range(3)]
+    try:
+        for i, fork in enumerate(forks):
+            assert fork.copy("VAR1", "VAR2") == {
+                "VAR1": "test",
+                "VAR2": "test test",
+            }
+            assert fork("test_function") == 42
+            # forks are isolated from the parent and each other
+            fork.load_file(io.BytesIO(b"VAR1=fork%d\n" % i))
+            assert fork["VAR1"] == "fork%d" % i
+        assert bash_server["VAR1"] == "test"
+        nested = forks[0].fork()
+        assert nested["VAR1"] == "fork0"
+        nested.terminate()
+    finally:
+        for fork in forks:
+            fork.terminate()
+    assert bash_server["VAR2"] == "test test"
@@ -3,8 +3,11 @@
 
 import pytest
 
+import itertools
 import os.path
 
+from gentoopm.basepm.depend import PMAnyOfDep, PMConditionalDep
+
 from . import PackageNames
 
 
@@ -88,6 +91,24 @@ def test_environ_fork(inst_pkg):
     del forkenv
 
 
+def test_environ_map(pm):
+    key = PackageNames.envsafe_metadata_key
+    envs = pm.installed.environ_map([key], workers=2)
+    assert envs
+    for pkg, env in envs.items():
+        assert env[key] == PackageNames.envsafe_metadata_acc(pkg)
+
+
+def test_environ_table(pm):
+    key = PackageNames.envsafe_metadata_key
+    rows = list(pm.installed.environ_table([key, "EAPI"], workers=2))
+    assert [pkg for pkg, env in rows] == list(pm.installed)
+    assert dict(rows) == pm.installed.environ_map([key, "EAPI"])
+    for pkg, env in rows:
+        assert env[key] == PackageNames.envsafe_metadata_acc(pkg)
+        assert env["EAPI"] == pkg.eapi
+
+
 def test_contents(inst_pkg):
     assert all(f in inst_pkg.contents for f in inst_pkg.contents)
 
@@ -139,3 +160,287 @@ def test_non_repo_masked(pm):
         assert not pkg.repo_masked
     except NotImplementedError:
         pytest.skip("repo_masked not implemented")
+
+
+def test_prefetch(repo):
+    pkgs = sorted(repo.filter(PackageNames.single_complete))
+    prefetched = sorted(
+        repo.filter(PackageNames.single_complete).prefetch("SLOT", "EAPI", "KEYWORDS")
+    )
+    assert prefetched == pkgs
+    assert [(p.slot, p.eapi, p.keywords) for p in prefetched] == [
+        (p.slot, p.eapi, p.keywords) for p in pkgs
+    ]
+
+
+def test_memoization(pm):
+    pm.enable_memoization()
+    try:
+        pkg = pm.stack.select(PackageNames.single_complete)
+        version = pkg.version
+        assert version is pkg.version
+        assert pkg.keywords is pkg.keywords
+        # another instance of the same package shares the memoised value
+        other = pm.stack.select(PackageNames.single_complete)
+        assert other.version is version
+        assert other.key == pkg.key
+        pm.reload_config()
+        assert pm.stack.select(PackageNames.single_complete).version is not version
+    finally:
+        pm.disable_memoization()
+    assert pkg.version is not pkg.version
+
+
+def test_memoization_config_roots(pm, other_pm):
+    pm.enable_memoization()
+    try:
+        pkg = pm.stack.select(PackageNames.single_complete)
+        other = other_pm.stack.select(PackageNames.single_complete)
+        assert not pkg.use[PackageNames.single_use].enabled
+        # the memoised values of one PM are not used by another one
+        assert other.use[PackageNames.single_use].enabled
+        assert not pkg.use[PackageNames.single_use].enabled
+    finally:
+        pm.disable_memoization()
+
+
+def _count_aux_get(pkg, monkeypatch):
+    dbapi = pkg._dbapi
+    orig = dbapi.aux_get
+    calls = []
+
+    def aux_get(cpv, keys, *args, **kwargs):
+        calls.append((cpv, tuple(keys)))
+        return orig(cpv, keys, *args, **kwargs)
+
+    monkeypatch.setattr(dbapi, "aux_get", aux_get)
+    return calls
+
+
+def test_prefetch_lookups(pm, monkeypatch):
+    if pm.name != "portage":
+        pytest.skip("metadata lookups are counted for portage only")
+
+    pkg = pm.stack.select(PackageNames.single_complete)
+    calls = _count_aux_get(pkg, monkeypatch)
+    # repeated lookups are answered from the package's cache
+    assert pkg.slot == pkg.slot
+    assert pkg.eapi == pkg.eapi
+    assert calls == [(pkg._cpv, ("SLOT",)), (pkg._cpv, ("EAPI",))]
+
+    # prefetching queries all keys at once, once per package
+    del calls[:]
+    pkgs = list(
+        pm.stack.filter(PackageNames.single_complete).prefetch(
+            "SLOT", "EAPI", "KEYWORDS"
+        )
+    )
+    assert sorted(calls) == sorted(
+        (p._cpv, ("SLOT", "EAPI", "KEYWORDS")) for p in pkgs
+    )
+    assert len(calls) == len(pkgs) > 1
+    del calls[:]
+    [(p.slot, p.eapi, p.keywords) for p in pkgs]
+    assert calls == []
+
+
+def test_memoization_lookups(pm, monkeypatch):
+    if pm.name != "portage":
+        pytest.skip("metadata lookups are counted for portage only")
+
+    pm.enable_memoization()
+    try:
+        pkg = pm.stack.select(PackageNames.single_complete)
+        calls = _count_aux_get(pkg, monkeypatch)
+        assert pkg.description.short == pkg.description.short
+        assert pkg.keywords == pkg.keywords
+        assert len(calls) == 2
+        # other instances reuse the values without querying metadata
+        other = pm.stack.select(PackageNames.single_complete)
+        assert other.description.short == pkg.description.short
+        assert other.keywords == pkg.keywords
+        assert len(calls) == 2
+        # but the values returned are bound to the right instance
+        assert other.description._pkg is other
+        assert pkg.description._pkg is pkg
+    finally:
+        pm.disable_memoization()
+
+
+def _dep_strings(deps):
+    def _dep(d):
+        if isinstance(d, PMConditionalDep):
+            return ("!" if d.negated else "") + d.flag + "?", _dep_strings(d)
+        if isinstance(d, PMAnyOfDep):
+            return ("||", _dep_strings(d))
+        return str(d)
+
+    return [_dep(d) for d in deps]
+
+
+def test_without_conditionals(pm):
+    pkg = pm.stack.select(PackageNames.depending)
+    assert _dep_strings(pkg.run_dependencies.without_conditionals) == [
+        "a/single",
+        ("||", ["b/multi", "a/multi"]),
+        "!a/pmasked",
+    ]
+    assert _dep_strings(pkg.cbuild_build_dependencies.without_conditionals) == []
+
+
+@pytest.mark.parametrize(
+    "use,expected",
+    [
+        ([], ["x/v"]),
+        (["a"], [("||", ["x/y"]), "x/v"]),
+        (["c"], ["x/w", "x/v"]),
+    ],
+)
+def test_without_conditionals_empty_groups(use, expected):
+    pytest.importorskip("portage")
+    from gentoopm.portagepm.atom import PortageAtom
+    from gentoopm.portagepm.depend import PortagePackageDepSet
+
+    deps = PortagePackageDepSet(
+        "|| ( a? ( x/y ) b? ( x/z ) ) c? ( ( x/w ) ) ( !c? ( ) ) x/v",
+        frozenset(use),
+        PortageAtom,
+    )
+    assert _dep_strings(deps.without_conditionals) == expected
+
+
+def test_depstring_cache(pm):
+    if pm.name != "portage":
+        pytest.skip("depstring cache is portage-specific")
+
+    from gentoopm.portagepm.depend import get_depstring_cache
+
+    cache = get_depstring_cache()
+    cache.clear()
+    pkg = pm.stack.select(PackageNames.depending)
+    first = list(pkg.build_dependencies)
+    misses, hits = cache.misses, cache.hits
+    # a fresh depset for the same string reuses the parsed tree
+    deps = pkg.build_dependencies
+    assert [str(d) for d in deps][:1] == [str(first[0])]
+    assert cache.misses == misses
+    assert cache.hits > hits
+
+
+def test_compact_deps(pm):
+    from gentoopm.basepm.compactdep import CompactDepTree, StringTable
+
+    pkg = pm.stack.select(PackageNames.depending)
+    table = StringTable()
+    tree = CompactDepTree.from_dep(pkg.run_dependencies, table)
+    assert tree.flags == {"example-flag"}
+    assert tree.atoms() == [
+        "a/single",
+        ">=a/multi-1",
+        "b/multi",
+        "a/multi",
+        "!a/pmasked",
+    ]
+    assert tree.atoms(["example-flag"]) == ["a/single", ">=a/multi-1", "!a/pmasked"]
+    assert tree.atoms([]) == ["a/single", "b/multi", "a/multi", "!a/pmasked"]
+    # atoms are shared through the string table
+    other = CompactDepTree.from_dep(pkg.build_dependencies, table)
+    assert other.atom_ids() == tree.atom_ids()[:-1]
+
+    # the view is equivalent to the original tree
+    dep = tree.to_dep()
+    assert _dep_strings(dep) == _dep_strings(pkg.run_dependencies)
+    assert _dep_strings(dep.without_conditionals) == _dep_strings(
+        pkg.run_dependencies.without_conditionals
+    )
+    assert CompactDepTree.from_dep(dep, table).atom_ids() == tree.atom_ids()
+
+
+def test_atoms_for_use(pm):
+    from gentoopm.basepm.compactdep import CompactDepTree
+
+    pkg = pm.stack.select(PackageNames.depending)
+    use_sets = [[], ["example-flag"], ["other-flag"], ["example-flag", "other-flag"]]
+    common = {"a/single", "!a/pmasked"}
+    expected = [
+        common | {"b/multi", "a/multi"},
+        common | {">=a/multi-1"},
+        common | {"b/multi", "a/multi"},
+        common | {">=a/multi-1"},
+    ]
+    assert pkg.run_dependencies.atoms_for_use(use_sets) == expected
+    tree = CompactDepTree.from_dep(pkg.run_dependencies)
+    assert tree.atoms_for_use(use_sets) == expected
+    assert tree.atoms_for_use(use_sets) == [set(tree.atoms(u)) for u in use_sets]
+    bdeps = pkg.cbuild_build_dependencies.atoms_for_use(use_sets)
+    assert bdeps == [set(), set(), {"a/subslotted:="}, {"a/subslotted:="}]
+
+
+def test_required_use_solver(pm):
+    from gentoopm.basepm.requse import get_required_use_solver_cache
+
+    pkg = pm.stack.select(PackageNames.depending)
+    solver = pkg.required_use_solver
+    assert solver.flags == ("example-flag", "other-flag", "third-flag")
+    assert pkg.required_use_solver is solver
+    hits = get_required_use_solver_cache().hits
+    assert pm.stack.select(PackageNames.depending).required_use_solver is solver
+    assert get_required_use_solver_cache().hits == hits + 1
+
+    assert solver.check(["example-flag"])
+    assert solver.check(["other-flag", "unrelated-flag"])
+    assert not solver.check([])
+    assert not solver.check(["example-flag", "third-flag"])
+    assert not solver.check(["other-flag", "third-flag"])
+
+    assert solver.configurations() == [{"other-flag"}, {"example-flag"}]
+    assert solver.configurations(1) == [{"other-flag"}]
+
+    assert solver.fix(["example-flag"]) == (set(), set())
+    assert solver.fix(["third-flag"]) == ({"example-flag"}, {"third-flag"})
+    assert solver.fix(["example-flag", "other-flag"]) == (set(), {"example-flag"})
+    assert solver.fix(["third-flag"], max_changes=1) is None
+    assert solver.fix(["third-flag"], max_changes=2) == (
+        {"example-flag"},
+        {"third-flag"},
+    )
+
+
+@pytest.mark.parametrize(
+    "required_use",
+    [
+        "^^ ( a? ( b ) c )",
+        "|| ( a? ( b ) c )",
+        "?? ( a b? ( c ) )",
+        "^^ ( a? ( b c ) d )",
+        "a? ( ^^ ( b c ) ) ?? ( !a? ( b ) c d? ( || ( a b ) ) )",
+        "|| ( a? ( c ) )",
+        "^^ ( a? ( c ) )",
+        "?? ( a? ( c ) )",
+        "|| ( ( a b ) )",
+        "^^ ( !a? ( b ) ) ?? ( ( c d ) )",
+    ],
+)
+def test_required_use_solver_matches_portage(required_use):
+    portage_dep = pytest.importorskip("portage.dep")
+    from gentoopm.basepm.requse import get_required_use_solver
+
+    flags = ("a", "b", "c", "d")
+    solver = get_required_use_solver(required_use, flags)
+    for n in range(len(flags) + 1):
+        for use in itertools.combinations(flags, n):
+            expected = portage_dep.check_required_use(
+                required_use, set(use), lambda f: True, eapi="8"
+            )
+            assert solver.check(use) == bool(expected), use
+
+
+@pytest.mark.parametrize(
+    "required_use",
+    ["|| ( a", "a )", "|| a", "a? b", "?? ( !? ( a ) )", "( a ) ||"],
+)
+def test_required_use_solver_invalid(required_use):
+    from gentoopm.basepm.requse import get_required_use_solver
+
+    with pytest.raises(ValueError):
+        get_required_use_solver(required_use, ("a",))
@@ -4,6 +4,7 @@
 import pytest
 
 from gentoopm.exceptions import AmbiguousPackageSetError, EmptyPackageSetError
+from gentoopm.matchers import RegExp
 
 from . import PackageNames
 
@@ -91,3 +92,41 @@ def test_atom_empty_contains(repo):
 def test_getitem_atom_empty(repo):
     with pytest.raises(EmptyPackageSetError):
         repo[PackageNames.empty]
+
+
+def test_best_matches_sorted(repo):
+    pkgs = repo.filter(PackageNames.single_complete)
+    assert pkgs.best == list(pkgs.sorted)[-1]
+
+
+def test_best_by(installable_repo):
+    pkgs = installable_repo.filter(PackageNames.multiple)
+    assert set(pkgs.best_by("slotted_atom")) == set(
+        pg.best for pg in pkgs.group_by("slotted_atom")
+    )
+
+
+def test_best_by_ambiguous(installable_repo):
+    with pytest.raises(AmbiguousPackageSetError):
+        list(installable_repo.filter(PackageNames.multiple).best_by("slot"))
+
+
+def test_filter_key_kwarg(repo):
+    pkgs = list(repo.filter(key=PackageNames.single_complete))
+    assert pkgs
+    assert all(p.key == PackageNames.single_complete for p in pkgs)
+
+
+def test_filter_chained_kwargs(repo):
+    pkgs = repo.filter(PackageNames.single).filter(key_category="a")
+    assert all(p.key.category == "a" for p in pkgs)
+    assert any(pkgs)
+
+
+def test_filter_plan_order(repo):
+    pkgs = repo.filter(
+        description_short=RegExp(".*"), key_package=RegExp(PackageNames.single)
+    )
+    plan = pkgs.explain()
+    assert plan.index("key.package") < plan.index("description.short")
+    assert any(pkgs)
@@ -1,6 +1,12 @@
 # (c) 2011-2024 Michał Górny <mgorny@gentoo.org>
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import os
+
+import pytest
+
+from gentoopm.basepm.depend import PMConditionalDep
+
 from . import PackageNames
 
 
@@ -23,3 +29,229 @@ def test_stack_repos_equiv(pm):
     stack_plist = set(pm.stack.filter(patom))
     repo_plist = set(pkg for repo in pm.repositories for pkg in repo.filter(patom))
     assert stack_plist == repo_plist
+
+
+def test_repo_index(pm):
+    repo = pm.repositories[PackageNames.repository]
+    patom = PackageNames.single_complete
+    expected = set(repo.filter(patom))
+    assert repo.index is None
+    repo.build_index()
+    try:
+        # the index is shared by all instances of the repository
+        idx = pm.repositories[PackageNames.repository].index
+        assert idx is not None
+        assert "a" in idx.categories
+        assert "single" in idx.packages("a")
+        assert patom in idx
+        assert [str(v) for v in idx.versions(patom)] == ["1", "2"]
+        assert set(repo.filter(key=patom)) == expected
+        assert set(repo.filter(patom, key_category="a")) == expected
+        assert set(pm.stack.filter(key=patom)) == expected
+        assert set(repo) == set(p for p in idx)
+    finally:
+        repo.drop_index()
+    assert repo.index is None
+
+
+@pytest.mark.parametrize(
+    "atom",
+    [
+        "a/single",
+        ">=a/single-2",
+        ">a/single-1",
+        "<a/single-2",
+        "<=a/single-2",
+        "=a/single-1",
+        "~a/single-1",
+        "=a/single-1*",
+        "a/single:0",
+        "a/single:1",
+        "a/subslotted:0/14",
+        "a/subslotted:0/1",
+        "=a/single-3",
+    ],
+)
+def test_repo_index_atom(pm, atom):
+    repo = pm.repositories[PackageNames.repository]
+    expected = set(repo.filter(atom))
+    repo.build_index()
+    try:
+        assert set(repo.filter(atom)) == expected
+        assert set(repo.filter(pm.Atom(atom))) == expected
+        assert "PMIndexedPackageSet(atom=" in repo.filter(atom).explain()
+        assert set(repo.index.match(pm.Atom(atom))) >= expected
+    finally:
+        repo.drop_index()
+
+
+def test_repo_snapshot(pm, tmp_path):
+    repo = pm.repositories[PackageNames.repository]
+    try:
+        snap = repo.load_snapshot(str(tmp_path))
+    except NotImplementedError:
+        pytest.skip(f"{pm.name} does not support snapshots")
+    try:
+        assert pm.repositories[PackageNames.repository].snapshot is snap
+        patom = PackageNames.single_complete
+        assert "a/single-1" in snap
+        assert "a/single-3" not in snap
+        assert snap.get("a/single-2")["SLOT"] == "0"
+        assert set(str(p) for p in repo) == set(
+            f"={p}::{repo.name}" for p in snap
+        )
+        assert [p.slot for p in repo.filter(patom)] == ["0", "0"]
+        # reloading an up-to-date snapshot reuses the file
+        mtime = os.stat(snap.path).st_mtime_ns
+        snap = repo.load_snapshot(str(tmp_path))
+        assert os.stat(snap.path).st_mtime_ns == mtime
+    finally:
+        repo.drop_snapshot()
+    assert repo.snapshot is None
+
+
+def test_repo_snapshot_drop_while_iterating(pm, tmp_path):
+    repo = pm.repositories[PackageNames.repository]
+    try:
+        repo.load_snapshot(str(tmp_path))
+    except NotImplementedError:
+        pytest.skip(f"{pm.name} does not support snapshots")
+    try:
+        expected = [str(p) for p in repo]
+        it = iter(repo)
+        first = str(next(it))
+        repo.drop_snapshot()
+        repo.load_snapshot(str(tmp_path))
+        repo.drop_snapshot()
+        # the iterator keeps using the snapshot it started with
+        assert [first] + [str(p) for p in it] == expected
+    finally:
+        repo.drop_snapshot()
+
+
+def test_repo_index_per_pm(pm, other_pm):
+    repo = pm.repositories[PackageNames.repository]
+    other_repo = other_pm.repositories[PackageNames.repository]
+    assert repo == other_repo
+    idx = repo.build_index()
+    try:
+        # packages of another PM instance are not served from the index
+        assert other_repo.index is None
+        other_repo.build_index()
+        assert pm.installed.package_names is pm.installed.package_names
+        names = pm.installed.package_names
+        # reloading one PM keeps the indexes of the other one
+        other_pm.reload_config()
+        assert other_pm.repositories[PackageNames.repository].index is None
+        assert pm.repositories[PackageNames.repository].index is idx
+        assert pm.installed.package_names is names
+    finally:
+        repo.drop_index()
+
+
+def test_repo_snapshot_default_dir(pm, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    repo = pm.repositories[PackageNames.repository]
+    try:
+        snap = repo.load_snapshot()
+    except NotImplementedError:
+        pytest.skip(f"{pm.name} does not support snapshots")
+    try:
+        assert os.path.dirname(snap.path) == str(tmp_path / "gentoopm")
+        assert os.listdir(tmp_path / "gentoopm") == [os.path.basename(snap.path)]
+    finally:
+        repo.drop_snapshot()
+
+
+def test_repository_stamp(tmp_path):
+    from gentoopm.basepm.snapshot import repository_stamp, write_snapshot
+
+    (tmp_path / "cat" / "pkg").mkdir(parents=True)
+    (tmp_path / "cat" / "pkg" / "pkg-1.ebuild").write_text("")
+    (tmp_path / "metadata").mkdir()
+    stamp = repository_stamp(str(tmp_path))
+    # snapshots written into the repository do not invalidate themselves
+    write_snapshot(str(tmp_path / "metadata" / "snapshot"), stamp, [])
+    assert repository_stamp(str(tmp_path)) == stamp
+    assert os.listdir(tmp_path / "metadata") == ["snapshot"]
+    (tmp_path / "cat" / "pkg" / "pkg-2.ebuild").write_text("")
+    assert repository_stamp(str(tmp_path)) != stamp
+
+
+def test_reverse_dependencies(pm, tmp_path):
+    repo = pm.repositories[PackageNames.repository]
+    dep_id = f"{PackageNames.depending}-1::{repo.name}"
+    idx = repo.reverse_dependencies()
+    assert PackageNames.depending not in idx
+    assert idx.packages("a/single") == {dep_id}
+    assert sorted(idx["a/single"]) == [
+        (dep_id, "build", (), "a/single"),
+        (dep_id, "post", (), "a/single"),
+        (dep_id, "run", (), "a/single"),
+    ]
+    multi = sorted((r.dep_class, r.use_condition, r.atom) for r in idx["a/multi"])
+    assert multi == [
+        ("build", ("!example-flag",), "a/multi"),
+        ("build", ("example-flag",), ">=a/multi-1"),
+        ("run", ("!example-flag",), "a/multi"),
+        ("run", ("example-flag",), ">=a/multi-1"),
+    ]
+    assert idx.packages("a/subslotted", ["run"]) == set()
+    assert idx.packages("a/subslotted", ["cbuild_build"]) == {dep_id}
+    # before EAPI 7, DEPEND is not indexed again as CBUILD dependencies
+    assert idx.packages("a/subslotted", ["build"]) == {f"b/multi-1::{repo.name}"}
+    assert [r.atom for r in idx["a/pmasked"]] == ["!a/pmasked"]
+
+    # the saved index is reused while the repository is unchanged
+    path = tmp_path / "revdep.json"
+    cached = pm.stack.reverse_dependencies(str(path))
+    mtime = os.stat(path).st_mtime_ns
+    loaded = pm.stack.reverse_dependencies(str(path))
+    assert os.stat(path).st_mtime_ns == mtime
+    assert sorted(loaded) == sorted(cached) == sorted(idx)
+    assert loaded["a/multi"] == cached["a/multi"]
+    # indexes of non-ebuild repositories are not saved
+    pm.installed.reverse_dependencies(str(tmp_path / "installed.json"))
+    assert os.listdir(tmp_path) == ["revdep.json"]
+
+
+def test_stack_repositories(pm):
+    assert list(pm.stack.repositories) == list(pm.repositories)
+
+
+def test_conditional_dep_flags(pm):
+    pkg = pm.stack.select(PackageNames.depending)
+    conds = [d for d in pkg.build_dependencies if isinstance(d, PMConditionalDep)]
+    assert [(d.flag, d.negated) for d in conds] == [
+        ("example-flag", False),
+        ("example-flag", True),
+    ]
+    # exactly one of the conditionals is enabled
+    assert sorted(d.enabled for d in conds) == [False, True]
+
+
+def test_package_names(pm):
+    repo = pm.repositories[PackageNames.repository]
+    names = repo.package_names
+    assert pm.repositories[PackageNames.repository].package_names is names
+    assert names.categories(PackageNames.multiple) == ["a", "b"]
+    assert names.keys(PackageNames.single) == [PackageNames.single_complete]
+    assert PackageNames.empty.split("/")[1] not in names
+    assert pm.stack.package_names.categories(PackageNames.multiple) == ["a", "b"]
+    # the merged index is reused until the repository indexes change
+    merged = pm.stack.package_names
+    assert pm.stack.package_names is merged
+    pm.reload_config()
+    assert pm.stack.package_names is not merged
+
+    assert names.complete("mul") == ["multi"]
+    assert names.complete("b") == ["b/"]
+    assert names.complete("a/s") == ["a/single", "a/subslotted"]
+
+    # unqualified atoms are expanded to all matching categories
+    assert set(str(p.key) for p in repo.filter(PackageNames.multiple)) == {
+        "a/multi",
+        "b/multi",
+    }
+    assert [str(p.version) for p in repo.filter(">=single-2")] == ["2"]
+    assert list(repo.filter("nonexist")) == []
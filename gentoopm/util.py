@@ -6,6 +6,7 @@ Utility functions for gentoopm.
 """
 
 import collections
+import threading
 from abc import ABCMeta
 
 
@@ -109,6 +110,86 @@ class SpaceSepFrozenSet(frozenset, _SpaceSepIter):
         return frozenset.__new__(self, s)
 
 
+class LRUCache(object):
+    """
+    A thread-safe, dict-like cache holding a bounded number of entries.
+    When the cache is full, the least recently used entries are discarded.
+    Lookups are counted as hits or misses.
+    """
+
+    def __init__(self, maxsize):
+        """
+        Create a new cache.
+
+        @param maxsize: maximum number of entries held
+        @type maxsize: int
+        """
+        self._maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def maxsize(self):
+        """
+        Maximum number of entries held.
+
+        @type: int
+        """
+        return self._maxsize
+
+    @property
+    def hits(self):
+        """
+        Number of lookups that found an entry.
+
+        @type: int
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        Number of lookups that did not find an entry.
+
+        @type: int
+        """
+        return self._misses
+
+    def __getitem__(self, k):
+        with self._lock:
+            try:
+                v = self._data[k]
+            except KeyError:
+                self._misses += 1
+                raise
+            self._hits += 1
+            self._data.move_to_end(k)
+            return v
+
+    def __setitem__(self, k, v):
+        with self._lock:
+            self._data[k] = v
+            self._data.move_to_end(k)
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, k):
+        with self._lock:
+            return k in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        """
+        Discard all entries.
+        """
+        with self._lock:
+            self._data.clear()
+
+
 def EnumTuple(name, *keys):
     """
     Create a namedtuple factory for an enumerated type. The resulting factory